@@ -1,8 +1,20 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import Body, FastAPI, File, Form, Header, Request, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from whisper_model import transcribe_audio, get_model_info
+from fastapi.responses import JSONResponse, Response
+from typing import List, Optional
+from whisper_model import (TASKS, calibration_transcribe, get_model, get_model_info, load_audio,
+                           set_torch_threads, transcribe_audio)
+from scheduler import LANES, scheduler
+from sessions import sessions
+from profiling import PROFILING_ENABLED, capture_flamegraph, span
+from responses import FastJSONResponse, encode_response
+from vocabulary import VocabularyError, registry as vocabularies
+from audio_probe import CorruptAudioError, EXTENSIONS, UnsupportedAudioError, probe_audio
+from lifecycle import drain, sweep_temp_audio, temp_audio_prefix, TEMP_AUDIO_DIR
+from autotune import AUTOTUNE_AUDIO_FILE, AUTOTUNE_AUDIO_SECONDS, calibrate, tuning
+import asyncio
 import os
+import time
 import tempfile
 import logging
 
@@ -15,7 +27,8 @@ app = FastAPI(
     description="Real-time speech-to-text for hearing-impaired using Whisper ASR",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse
 )
 
 # Add CORS middleware for web frontend integration
@@ -27,6 +40,88 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Endpoints that start transcription work and are refused while draining
+WORK_PATH_PREFIXES = ("/transcribe/", "/sessions/")
+
+# Held while a calibration runs; the instance reports not-ready meanwhile
+_autotune_lock = asyncio.Lock()
+_autotune_task = None
+
+@app.on_event("startup")
+async def preload_model():
+    """Load the Whisper model in the background so the server starts accepting connections immediately"""
+    if os.getenv("PRELOAD_MODEL", "true").lower() == "true":
+        asyncio.get_running_loop().run_in_executor(None, _preload_model)
+
+@app.on_event("startup")
+async def prepare_shutdown():
+    """Sweep temp audio left by earlier processes and drain requests on SIGTERM"""
+    removed = sweep_temp_audio()
+    if removed:
+        logger.info(f"Removed {removed} leftover temporary audio file(s)")
+    drain.install_signal_handler()
+
+@app.on_event("startup")
+async def autotune_on_startup():
+    """Calibrate workers and torch threads on first start when no configuration is saved or set"""
+    global _autotune_task
+    if os.getenv("AUTOTUNE_ON_STARTUP", "false").lower() == "true" and tuning["source"] == "default":
+        _autotune_task = asyncio.create_task(_run_autotune())
+
+async def _run_autotune() -> dict:
+    """Benchmark the candidate configurations and switch to the fastest one"""
+    async with _autotune_lock:
+        # Calibration changes process-wide torch threads and needs the cores to itself
+        async with scheduler.hold():
+            logger.info("Calibrating worker and torch thread counts")
+            audio = None
+            if AUTOTUNE_AUDIO_FILE:
+                audio = (await asyncio.to_thread(load_audio, AUTOTUNE_AUDIO_FILE))[:int(AUTOTUNE_AUDIO_SECONDS * 16000)]
+            result = await asyncio.to_thread(calibrate, calibration_transcribe, set_torch_threads, audio)
+            set_torch_threads(result["torch_threads"])
+            await scheduler.resize(result["workers"])
+        tuning.update(workers=result["workers"], source="autotune", measured_throughput=result["throughput"])
+        logger.info(f"Autotune selected {result['workers']} worker(s) x {result['torch_threads']} torch thread(s), "
+                    f"{result['throughput']}x realtime")
+        return result
+
+def _preload_model():
+    try:
+        get_model()
+    except Exception as e:
+        logger.error(f"Model preload failed: {str(e)}")
+
+@app.middleware("http")
+async def track_in_flight(request: Request, call_next):
+    """Count in-flight transcription work and refuse new work while draining or calibrating"""
+    if not request.url.path.startswith(WORK_PATH_PREFIXES):
+        return await call_next(request)
+    if drain.draining:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server is shutting down, retry on another instance"},
+            headers={"Retry-After": "5"}
+        )
+    if _autotune_lock.locked():
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Server is calibrating, retry shortly or on another instance"},
+            headers={"Retry-After": "30"}
+        )
+    drain.start()
+    try:
+        return await call_next(request)
+    finally:
+        drain.finish()
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Record a root span per request when profiling is enabled"""
+    with span(f"{request.method} {request.url.path}") as request_span:
+        response = await call_next(request)
+        request_span.set_attribute("http.status_code", response.status_code)
+        return response
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -53,55 +148,108 @@ async def health_check():
             content={"status": "unhealthy", "error": str(e)}
         )
 
+@app.get("/ready")
+async def readiness():
+    """Readiness probe; reports not-ready while the model loads or the server drains for shutdown"""
+    if drain.draining:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "draining", "in_flight": drain.in_flight}
+        )
+    if _autotune_lock.locked():
+        return JSONResponse(status_code=503, content={"status": "calibrating"})
+    model_loaded = get_model_info()["loaded"]
+    if not model_loaded and os.getenv("PRELOAD_MODEL", "true").lower() == "true":
+        # Requests routed here now would block until the background load finishes
+        return JSONResponse(status_code=503, content={"status": "loading", "model_loaded": False})
+    return {"status": "ready", "model_loaded": model_loaded}
+
 @app.post("/transcribe/")
-async def transcribe(file: UploadFile = File(...)):
-    """Transcribe audio file to text"""
+async def transcribe(request: Request, file: UploadFile = File(...), priority: Optional[str] = Form(None),
+                     diarize: bool = Form(False), tenant: Optional[str] = Form(None),
+                     task: str = Form("transcribe")):
+    """Transcribe audio file to text
+
+    priority selects the scheduling lane: "live" (the default) for interactive
+    captions, "batch" for bulk or archival audio that may wait for spare capacity.
+    Audio sent with an explicit "live" priority has a tighter duration limit.
+    diarize adds a speaker label to each segment.
+    tenant applies that tenant's registered vocabulary.
+    task "translate" returns English text instead of the original language;
+    "both" returns the transcript plus an English translation per segment.
+    The response format follows the Accept and Accept-Encoding headers.
+    """
     # Validate file
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
     
-    # Check file size (25MB limit)
-    max_size = int(os.getenv("MAX_FILE_SIZE", 26214400))  # 25MB default
-    if file.size and file.size > max_size:
-        raise HTTPException(status_code=413, detail=f"File too large. Maximum size: {max_size} bytes")
+    requested_priority = priority
+    priority = priority or "live"
+    if priority not in LANES:
+        raise HTTPException(status_code=400, detail=f"Invalid priority. Expected one of: {', '.join(LANES)}")
+    
+    _check_tenant(tenant)
+    
+    if task not in TASKS:
+        raise HTTPException(status_code=400, detail=f"Invalid task. Expected one of: {', '.join(TASKS)}")
     
-    # Validate file type
-    allowed_types = ["audio/wav", "audio/mpeg", "audio/mp3", "audio/m4a", "audio/flac", "audio/ogg"]
-    if file.content_type and file.content_type not in allowed_types:
-        logger.warning(f"Received file with content type: {file.content_type}")
-        # Don't reject - some valid audio files might have incorrect content types
+    if task != "transcribe" and not get_model_info()["is_multilingual"]:
+        raise HTTPException(status_code=400, detail="The loaded English-only model cannot translate")
+    
+    # Check file size (25MB limit)
+    _check_file_size(file)
     
     temp_file_path = None
     try:
         logger.info(f"Processing audio file: {file.filename}")
         
         # Read audio data
-        audio_data = await file.read()
+        with span("upload_read"):
+            audio_data = await file.read()
         logger.info(f"File size: {len(audio_data)} bytes")
         
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_file:
-            temp_file.write(audio_data)
-            temp_file_path = temp_file.name
+        # Validate the audio from its header; the content type is often wrong
+        audio_info = _probe_upload(audio_data)
+        _admit_audio(audio_info, requested_priority)
+        estimated = scheduler.estimate_processing(audio_info["duration"] or 0.0)
         
-        logger.info(f"Created temporary file: {temp_file_path}")
+        # Create temporary file
+        temp_file_path = _write_temp_audio(audio_data, EXTENSIONS[audio_info["format"]])
         
-        # Transcribe audio
-        result = transcribe_audio(temp_file_path)
+        # Transcribe audio in the requested priority lane
+        started = time.perf_counter()
+        result, queue_wait = await scheduler.run(priority, transcribe_audio, temp_file_path,
+                                                 diarize=diarize, tenant=tenant, task=task)
+        processing_seconds = time.perf_counter() - started - queue_wait
+        if audio_info["duration"]:
+            scheduler.observe_processing(audio_info["duration"], processing_seconds)
         
         logger.info(f"Transcription completed. Text length: {len(result['text'])}")
         
         # Return enhanced response
-        return {
+        response = {
             "transcript": result["text"],
             "language": result.get("language", "unknown"),
             "confidence": result.get("confidence", 0.0),
+            "segments": [_segment_response(segment) for segment in result["segments"]],
             "processing_info": {
                 "file_name": file.filename,
                 "file_size": len(audio_data),
-                "model_used": get_model_info()["model_type"]
+                "model_used": get_model_info()["model_type"],
+                "task": task,
+                "priority": priority,
+                "queue_wait_ms": round(queue_wait * 1000, 2),
+                "audio": audio_info,
+                "estimated_processing_seconds": round(estimated, 3) if audio_info["duration"] else None,
+                "processing_seconds": round(processing_seconds, 3)
             }
         }
+        if "translation" in result:
+            response["translation"] = result["translation"]
+        return encode_response(request, response)
+    
+    except HTTPException:
+        raise
     
     except Exception as e:
         logger.error(f"Transcription failed: {str(e)}")
@@ -109,19 +257,228 @@ async def transcribe(file: UploadFile = File(...)):
     
     finally:
         # Clean up temporary file
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.unlink(temp_file_path)
-                logger.info(f"Cleaned up temporary file: {temp_file_path}")
-            except Exception as cleanup_error:
-                logger.warning(f"Failed to cleanup temp file: {cleanup_error}")
+        _remove_temp_audio(temp_file_path)
+
+@app.post("/sessions/{session_id}/audio")
+async def append_session_audio(session_id: str, file: UploadFile = File(...), priority: Optional[str] = Form(None),
+                               tenant: Optional[str] = Form(None)):
+    """Append an audio chunk to a growing recording and transcribe only the new tail"""
+    if not file.filename:
+        raise HTTPException(status_code=400, detail="No file provided")
+    
+    requested_priority = priority
+    priority = priority or "live"
+    if priority not in LANES:
+        raise HTTPException(status_code=400, detail=f"Invalid priority. Expected one of: {', '.join(LANES)}")
+    
+    _check_tenant(tenant)
+    
+    # Chunks get the same admission checks as whole uploads
+    _check_file_size(file)
+    
+    temp_file_path = None
+    try:
+        audio_data = await file.read()
+        audio_info = _probe_upload(audio_data)
+        _admit_audio(audio_info, requested_priority)
+        
+        # Probe and admit before taking a session slot so rejected uploads do not use one up
+        session = sessions.get_or_create(session_id, tenant)
+        if session is None:
+            raise HTTPException(status_code=429, detail="Too many active sessions")
+        
+        temp_file_path = _write_temp_audio(audio_data, EXTENSIONS[audio_info["format"]])
+        
+        # Updates to one session must be applied in order
+        async with session.lock:
+            update, queue_wait = await scheduler.run(priority, session.append, temp_file_path)
+        
+        logger.info(f"Session {session_id} updated with {update['chunk_seconds']}s of audio")
+        
+        return {
+            **session.summary(),
+            **update,
+            "processing_info": {
+                "file_name": file.filename,
+                "file_size": len(audio_data),
+                "model_used": get_model_info()["model_type"],
+                "priority": priority,
+                "queue_wait_ms": round(queue_wait * 1000, 2)
+            }
+        }
+    
+    except HTTPException:
+        raise
+    
+    except Exception as e:
+        logger.error(f"Session update failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Session update failed: {str(e)}")
+    
+    finally:
+        _remove_temp_audio(temp_file_path)
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    """Get the current transcript of a session"""
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session.summary()
+
+@app.delete("/sessions/{session_id}")
+async def close_session(request: Request, session_id: str):
+    """Close a session and return its final transcript"""
+    session = sessions.pop(session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    async with session.lock:
+        return encode_response(request, session.close())
+
+def _check_admin_token(x_admin_token: Optional[str]):
+    """Reject the request if ADMIN_TOKEN is set and the header does not match"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if admin_token and x_admin_token != admin_token:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def _check_tenant(tenant: Optional[str]):
+    """Reject a tenant with no registered vocabulary, which is most likely a typo"""
+    if tenant and vocabularies.get(tenant) is None:
+        raise HTTPException(status_code=422, detail=f"No vocabulary registered for tenant '{tenant}'")
+
+def _segment_response(segment: dict) -> dict:
+    """Reduce a Whisper segment to the fields returned to clients"""
+    response = {
+        "start": round(segment["start"], 3),
+        "end": round(segment["end"], 3),
+        "text": segment["text"].strip()
+    }
+    if "translation" in segment:
+        response["translation"] = segment["translation"]
+    if "speaker" in segment:
+        response["speaker"] = segment["speaker"]
+    if segment.get("suppressed"):
+        response["suppressed"] = True
+    return response
+
+def _probe_upload(audio_data: bytes) -> dict:
+    """Sniff and probe an upload, rejecting anything that cannot be decoded"""
+    try:
+        audio_info = probe_audio(audio_data)
+    except UnsupportedAudioError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except CorruptAudioError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    logger.info(f"Probed audio: {audio_info}")
+    return audio_info
+
+def _check_file_size(file: UploadFile):
+    """Reject uploads over MAX_FILE_SIZE before reading them"""
+    max_size = int(os.getenv("MAX_FILE_SIZE", 26214400))  # 25MB default
+    if file.size and file.size > max_size:
+        raise HTTPException(status_code=413, detail=f"File too large. Maximum size: {max_size} bytes")
+
+def _admit_audio(audio_info: dict, requested_priority: Optional[str]):
+    """Reject audio longer than the limit; the live limit applies only when live was asked for"""
+    duration = audio_info["duration"]
+    if duration is None:
+        return
+    max_duration = float(os.getenv("MAX_AUDIO_DURATION", 1800))
+    if requested_priority == "live":
+        max_duration = min(max_duration, float(os.getenv("LIVE_MAX_AUDIO_DURATION", 120)))
+    if duration > max_duration:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Audio too long: {duration}s. Maximum: {max_duration:g}s"
+        )
+
+def _write_temp_audio(audio_data: bytes, suffix: str = ".wav") -> str:
+    """Write uploaded audio to a temporary file and return its path"""
+    with span("temp_write", bytes=len(audio_data)):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, prefix=temp_audio_prefix(),
+                                         dir=TEMP_AUDIO_DIR) as temp_file:
+            temp_file.write(audio_data)
+            temp_file_path = temp_file.name
+    
+    logger.info(f"Created temporary file: {temp_file_path}")
+    return temp_file_path
+
+def _remove_temp_audio(temp_file_path):
+    """Remove a temporary audio file if it exists"""
+    if temp_file_path and os.path.exists(temp_file_path):
+        try:
+            os.unlink(temp_file_path)
+            logger.info(f"Cleaned up temporary file: {temp_file_path}")
+        except Exception as cleanup_error:
+            logger.warning(f"Failed to cleanup temp file: {cleanup_error}")
 
 @app.get("/info")
 async def model_info():
     """Get model information"""
     return get_model_info()
 
+@app.get("/scheduler")
+async def scheduler_stats():
+    """Get per-lane queue depth and queue-wait statistics"""
+    return scheduler.stats()
+
+@app.put("/tenants/{tenant_id}/vocabulary")
+async def register_vocabulary(tenant_id: str, terms: List[str] = Body(..., embed=True),
+                              x_admin_token: Optional[str] = Header(None)):
+    """Register the hotwords used to bias transcriptions for a tenant"""
+    _check_admin_token(x_admin_token)
+    try:
+        return vocabularies.register(tenant_id, terms)
+    except VocabularyError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.get("/tenants/{tenant_id}/vocabulary")
+async def get_vocabulary(tenant_id: str):
+    """Get the vocabulary registered for a tenant"""
+    vocabulary = vocabularies.get(tenant_id)
+    if vocabulary is None:
+        raise HTTPException(status_code=404, detail="No vocabulary registered for tenant")
+    return vocabulary
+
+@app.delete("/tenants/{tenant_id}/vocabulary")
+async def delete_vocabulary(tenant_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Remove a tenant's vocabulary"""
+    _check_admin_token(x_admin_token)
+    if not vocabularies.remove(tenant_id):
+        raise HTTPException(status_code=404, detail="No vocabulary registered for tenant")
+    return {"tenant_id": tenant_id, "deleted": True}
+
+@app.get("/admin/profile")
+async def capture_profile(seconds: float = 10, x_admin_token: Optional[str] = Header(None)):
+    """Capture a flamegraph of the live process over a time window"""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled")
+    
+    # Sampling holds the GIL for the whole window and exposes source paths
+    if not os.getenv("ADMIN_TOKEN"):
+        raise HTTPException(status_code=403, detail="Profiling requires ADMIN_TOKEN to be set")
+    _check_admin_token(x_admin_token)
+    
+    # Sample from a worker thread so the event loop keeps serving requests
+    content, media_type = await asyncio.to_thread(capture_flamegraph, seconds)
+    return Response(content=content, media_type=media_type)
+
+@app.post("/admin/autotune")
+async def run_autotune(x_admin_token: Optional[str] = Header(None)):
+    """Benchmark worker and torch thread counts on this host, then apply and save the best"""
+    # Calibration takes every core for minutes, so it is never open to anonymous clients
+    if not os.getenv("ADMIN_TOKEN"):
+        raise HTTPException(status_code=403, detail="Autotune requires ADMIN_TOKEN to be set")
+    _check_admin_token(x_admin_token)
+    if _autotune_lock.locked():
+        raise HTTPException(status_code=409, detail="Calibration already running")
+    try:
+        return await _run_autotune()
+    except Exception as e:
+        logger.error(f"Autotune failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Autotune failed: {str(e)}")
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 7860))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # Requests have already been drained when uvicorn gets the signal; this only bounds stragglers
+    uvicorn.run(app, host="0.0.0.0", port=port, timeout_graceful_shutdown=10)
\ No newline at end of file
@@ -0,0 +1,297 @@
+# audio_probe.py
+import struct
+from typing import Dict, Iterator, Optional, Tuple
+
+# How far past an ID3 tag to look for the first MP3 frame
+MP3_SYNC_SEARCH_BYTES = 65536
+
+# File extension used for the temporary upload of each format, so ffmpeg sees the right one
+EXTENSIONS = {
+    "wav": ".wav", "flac": ".flac", "ogg": ".ogg", "mp3": ".mp3", "aac": ".aac",
+    "mp4": ".m4a", "webm": ".webm", "aiff": ".aiff",
+}
+
+_MP3_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {1: [44100, 48000, 32000], 2: [22050, 24000, 16000], 25: [11025, 12000, 8000]}
+_AAC_SAMPLE_RATES = [96000, 88200, 64000, 48000, 44100, 32000, 24000, 22050, 16000, 12000, 11025, 8000, 7350]
+
+
+class UnsupportedAudioError(ValueError):
+    """The upload is not in a recognised audio container."""
+
+
+class CorruptAudioError(ValueError):
+    """The upload looks like audio but its header is broken or empty."""
+
+
+def sniff_format(data: bytes) -> Optional[str]:
+    """Identify the container from its magic bytes."""
+    if data[:4] in (b"RIFF", b"RF64") and data[8:12] == b"WAVE":
+        return "wav"
+    if data[:4] == b"fLaC":
+        return "flac"
+    if data[:4] == b"OggS":
+        return "ogg"
+    if data[:3] == b"ID3":
+        return "mp3"
+    if data[4:8] == b"ftyp":
+        return "mp4"
+    if data[:4] == b"\x1a\x45\xdf\xa3":
+        return "webm"
+    if data[:4] == b"FORM" and data[8:12] in (b"AIFF", b"AIFC"):
+        return "aiff"
+    if len(data) >= 2 and data[0] == 0xFF and data[1] & 0xE0 == 0xE0:
+        # MPEG audio frame sync; ADTS AAC uses layer bits 00
+        return "aac" if (data[1] >> 1) & 3 == 0 else "mp3"
+    return None
+
+
+def probe_audio(data: bytes) -> Dict:
+    """
+    Read format, duration, sample rate and channels from the header alone.
+
+    Fields that a format does not expose without decoding are None.
+
+    Raises:
+        UnsupportedAudioError: If the bytes are not a known audio format
+        CorruptAudioError: If the header is recognised but unusable
+    """
+    if not data:
+        raise CorruptAudioError("Empty file")
+    audio_format = sniff_format(data)
+    if audio_format is None:
+        raise UnsupportedAudioError("Unrecognised audio format")
+
+    probe = _PROBES.get(audio_format)
+    info = {"format": audio_format, "duration": None, "sample_rate": None, "channels": None}
+    if probe is not None:
+        try:
+            info.update(probe(data))
+        except (struct.error, IndexError, ValueError, OverflowError) as e:
+            if isinstance(e, (UnsupportedAudioError, CorruptAudioError)):
+                raise
+            raise CorruptAudioError(f"Invalid {audio_format} header: {e}")
+
+    if info["channels"] is not None and info["channels"] < 1:
+        raise CorruptAudioError(f"Invalid {audio_format} header: no channels")
+    if info["sample_rate"] is not None and info["sample_rate"] < 1:
+        raise CorruptAudioError(f"Invalid {audio_format} header: no sample rate")
+    if info["duration"] is not None:
+        if info["duration"] <= 0:
+            raise CorruptAudioError("File contains no audio")
+        info["duration"] = round(info["duration"], 3)
+    return info
+
+
+def _probe_wav(data: bytes) -> Dict:
+    fmt = None
+    for chunk_id, start, end in _riff_chunks(data, 12):
+        if chunk_id == b"fmt ":
+            channels, sample_rate, byte_rate = struct.unpack_from("<HII", data, start + 2)
+            fmt = {"channels": channels, "sample_rate": sample_rate, "byte_rate": byte_rate}
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise CorruptAudioError("Invalid wav header: data before fmt chunk")
+            # Streaming writers leave the size at 0 or 0xFFFFFFFF, and truncated
+            # files declare more data than they carry; use what is actually there
+            size = (len(data) if end == start else min(end, len(data))) - start
+            duration = size / fmt["byte_rate"] if fmt["byte_rate"] else None
+            return {"channels": fmt["channels"], "sample_rate": fmt["sample_rate"], "duration": duration}
+    raise CorruptAudioError("Invalid wav header: no data chunk")
+
+
+def _riff_chunks(data: bytes, offset: int) -> Iterator[Tuple[bytes, int, int]]:
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        size, = struct.unpack_from("<I", data, offset + 4)
+        start = offset + 8
+        yield chunk_id, start, start + size
+        # Chunks are word aligned
+        offset = start + size + (size & 1)
+
+
+def _probe_flac(data: bytes) -> Dict:
+    if data[4] & 0x7F != 0:
+        raise CorruptAudioError("Invalid flac header: missing STREAMINFO")
+    fields = int.from_bytes(data[18:26], "big")
+    sample_rate = fields >> 44
+    channels = ((fields >> 41) & 0x7) + 1
+    total_samples = fields & ((1 << 36) - 1)
+    # A total of zero means "unknown" in STREAMINFO
+    duration = total_samples / sample_rate if total_samples and sample_rate else None
+    return {"channels": channels, "sample_rate": sample_rate, "duration": duration}
+
+
+def _probe_ogg(data: bytes) -> Dict:
+    n_segments = data[26]
+    packet = data[27 + n_segments:27 + n_segments + 64]
+    last_page = data.rfind(b"OggS")
+    granule, = struct.unpack_from("<q", data, last_page + 6)
+
+    if packet.startswith(b"OpusHead"):
+        channels = packet[9]
+        pre_skip, input_rate = struct.unpack_from("<HI", packet, 10)
+        # Opus granule positions always count 48 kHz samples
+        duration = (granule - pre_skip) / 48000 if granule > 0 else None
+        return {"channels": channels, "sample_rate": input_rate or 48000, "duration": duration}
+    if packet.startswith(b"\x01vorbis"):
+        channels = packet[11]
+        sample_rate, = struct.unpack_from("<I", packet, 12)
+        duration = granule / sample_rate if granule > 0 and sample_rate else None
+        return {"channels": channels, "sample_rate": sample_rate, "duration": duration}
+    return {}
+
+
+def _probe_mp3(data: bytes) -> Dict:
+    offset = 0
+    if data[:3] == b"ID3":
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        offset = 10 + size + (10 if data[5] & 0x10 else 0)
+
+    limit = min(len(data) - 4, offset + MP3_SYNC_SEARCH_BYTES)
+    while offset < limit and not (data[offset] == 0xFF and data[offset + 1] & 0xE0 == 0xE0):
+        offset += 1
+    if offset >= limit:
+        raise CorruptAudioError("Invalid mp3 header: no audio frames")
+
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    version = {3: 1, 2: 2, 0: 25}.get((b1 >> 3) & 3)
+    layer = {3: 1, 2: 2, 1: 3}.get((b1 >> 1) & 3)
+    bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+    if version is None or layer is None or bitrate_index == 15 or rate_index == 3:
+        raise CorruptAudioError("Invalid mp3 header: bad frame header")
+
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    channels = 1 if b3 >> 6 == 3 else 2
+    bitrate = _MP3_BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    samples_per_frame = 384 if layer == 1 else (576 if layer == 3 and version != 1 else 1152)
+
+    # A Xing/Info header in the first frame gives the exact frame count of VBR files
+    for tag in (b"Xing", b"Info"):
+        position = data.find(tag, offset, offset + 200)
+        if position != -1:
+            flags, = struct.unpack_from(">I", data, position + 4)
+            if flags & 1:
+                frames, = struct.unpack_from(">I", data, position + 8)
+                return {"channels": channels, "sample_rate": sample_rate,
+                        "duration": frames * samples_per_frame / sample_rate}
+
+    # Otherwise assume constant bitrate; free-format streams give no estimate
+    duration = (len(data) - offset) * 8 / bitrate if bitrate else None
+    return {"channels": channels, "sample_rate": sample_rate, "duration": duration}
+
+
+def _probe_aac(data: bytes) -> Dict:
+    rate_index = (data[2] >> 2) & 0xF
+    if rate_index >= len(_AAC_SAMPLE_RATES):
+        raise CorruptAudioError("Invalid aac header: bad sample rate index")
+    channels = ((data[2] & 1) << 2) | (data[3] >> 6)
+    # Channel configuration 0 means it is signalled in-band
+    return {"channels": channels or None, "sample_rate": _AAC_SAMPLE_RATES[rate_index]}
+
+
+def _probe_mp4(data: bytes) -> Dict:
+    moov = _find_box(data, 0, len(data), b"moov")
+    if moov is None:
+        raise CorruptAudioError("Invalid mp4 header: no moov box")
+
+    info = {}
+    mvhd = _find_box(data, moov[0], moov[1], b"mvhd")
+    if mvhd is not None:
+        start = mvhd[0]
+        if data[start] == 1:
+            timescale, duration = struct.unpack_from(">IQ", data, start + 20)
+        else:
+            timescale, duration = struct.unpack_from(">II", data, start + 12)
+        if timescale:
+            # Fragmented files leave the total at 0 and describe each fragment in a moof box
+            info["duration"] = duration / timescale if duration else None
+
+    for box_type, start, end in _mp4_boxes(data, moov[0], moov[1]):
+        if box_type != b"trak":
+            continue
+        mdia = _find_box(data, start, end, b"mdia")
+        hdlr = mdia and _find_box(data, mdia[0], mdia[1], b"hdlr")
+        if not hdlr or data[hdlr[0] + 8:hdlr[0] + 12] != b"soun":
+            continue
+        stsd = _find_path(data, mdia, [b"minf", b"stbl", b"stsd"])
+        if stsd is not None:
+            # First sample entry: size, format, reserved[6], data reference, then the audio fields
+            entry = stsd[0] + 8
+            channels, = struct.unpack_from(">H", data, entry + 24)
+            sample_rate, = struct.unpack_from(">I", data, entry + 32)
+            info.update({"channels": channels, "sample_rate": sample_rate >> 16})
+        return info
+    raise CorruptAudioError("Invalid mp4 header: no audio track")
+
+
+def _mp4_boxes(data: bytes, offset: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header = 8
+        if size == 1:
+            size, = struct.unpack_from(">Q", data, offset + 8)
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            raise CorruptAudioError("Invalid mp4 header: bad box size")
+        yield box_type, offset + header, min(offset + size, end)
+        offset += size
+
+
+def _find_box(data: bytes, start: int, end: int, box_type: bytes) -> Optional[Tuple[int, int]]:
+    for found_type, box_start, box_end in _mp4_boxes(data, start, end):
+        if found_type == box_type:
+            return box_start, box_end
+    return None
+
+
+def _find_path(data: bytes, box: Tuple[int, int], path) -> Optional[Tuple[int, int]]:
+    for box_type in path:
+        box = _find_box(data, box[0], box[1], box_type)
+        if box is None:
+            return None
+    return box
+
+
+def _probe_aiff(data: bytes) -> Dict:
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        size, = struct.unpack_from(">I", data, offset + 4)
+        if chunk_id == b"COMM":
+            channels, frames = struct.unpack_from(">HI", data, offset + 8)
+            sample_rate = _extended_to_float(data[offset + 16:offset + 26])
+            duration = frames / sample_rate if sample_rate else None
+            return {"channels": channels, "sample_rate": int(sample_rate), "duration": duration}
+        offset += 8 + size + (size & 1)
+    raise CorruptAudioError("Invalid aiff header: no COMM chunk")
+
+
+def _extended_to_float(raw: bytes) -> float:
+    """80-bit IEEE 754 extended precision, as used for the AIFF sample rate."""
+    exponent, mantissa = struct.unpack(">HQ", raw)
+    sign = -1 if exponent & 0x8000 else 1
+    exponent &= 0x7FFF
+    if exponent == 0 and mantissa == 0:
+        return 0.0
+    return sign * mantissa * 2.0 ** (exponent - 16383 - 63)
+
+
+_PROBES = {
+    "wav": _probe_wav,
+    "flac": _probe_flac,
+    "ogg": _probe_ogg,
+    "mp3": _probe_mp3,
+    "aac": _probe_aac,
+    "mp4": _probe_mp4,
+    "aiff": _probe_aiff,
+}
@@ -0,0 +1,197 @@
+# autotune.py
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Best configuration found by calibration, reused on the next start of the same host
+AUTOTUNE_FILE = os.getenv("AUTOTUNE_FILE", "autotune.json")
+# Seconds of calibration audio transcribed per worker in each trial
+AUTOTUNE_AUDIO_SECONDS = float(os.getenv("AUTOTUNE_AUDIO_SECONDS", 20))
+AUTOTUNE_ROUNDS = int(os.getenv("AUTOTUNE_ROUNDS", 2))
+# Speech clip to calibrate on; synthetic audio is used when unset
+AUTOTUNE_AUDIO_FILE = os.getenv("AUTOTUNE_AUDIO_FILE")
+
+CPU_COUNT = os.cpu_count() or 1
+
+# Workers kept free for live captions; batch work needs at least one more,
+# so that is the smallest pool the scheduler can honour the reservation with
+LIVE_RESERVED_WORKERS = max(0, int(os.getenv("LIVE_RESERVED_WORKERS", 1)))
+MIN_WORKERS = LIVE_RESERVED_WORKERS + 1
+
+
+def resolve_config() -> Dict:
+    """
+    Worker and torch thread counts to run with.
+
+    Explicit environment variables win, then a calibration saved for this
+    host, then a default of MIN_WORKERS. Unless TORCH_THREADS is set or
+    the worker count was calibrated, each worker gets an equal share of the
+    cores so overlapping requests do not oversubscribe them.
+    """
+    saved = load_saved_config()
+    config = {
+        "workers": saved["workers"] if saved else MIN_WORKERS,
+        "torch_threads": saved["torch_threads"] if saved else None,
+        "torch_interop_threads": 1,
+        "source": "autotune" if saved else "default",
+        "measured_throughput": saved.get("throughput") if saved else None,
+    }
+    if os.getenv("TRANSCRIBE_WORKERS"):
+        config["workers"] = max(1, int(os.getenv("TRANSCRIBE_WORKERS")))
+        config["source"] = "env"
+        # A saved thread count was tuned for the calibrated pool size, not this one
+        config["torch_threads"] = None
+    if os.getenv("TORCH_THREADS"):
+        config["torch_threads"] = max(1, int(os.getenv("TORCH_THREADS")))
+        config["source"] = "env"
+    if os.getenv("TORCH_INTEROP_THREADS"):
+        config["torch_interop_threads"] = max(1, int(os.getenv("TORCH_INTEROP_THREADS")))
+    if config["torch_threads"] is None:
+        config["torch_threads"] = max(1, CPU_COUNT // config["workers"])
+    return config
+
+
+def load_saved_config() -> Optional[Dict]:
+    """The saved calibration, if it was measured on a host like this one."""
+    if not AUTOTUNE_FILE or not os.path.exists(AUTOTUNE_FILE):
+        return None
+    try:
+        with open(AUTOTUNE_FILE) as autotune_file:
+            saved = json.load(autotune_file)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable autotune file {AUTOTUNE_FILE}: {e}")
+        return None
+    if saved.get("host", {}) != _host():
+        logger.info("Saved autotune result was measured on a different host or model, ignoring it")
+        return None
+    return saved
+
+
+def candidate_configs(cpu_count: int = CPU_COUNT) -> List[Dict]:
+    """
+    Power-of-two worker and thread counts that do not oversubscribe the cores.
+
+    Pools too small to keep the live reservation are left out unless the
+    host has too few cores for anything else.
+    """
+    candidates = []
+    workers = 1
+    while workers <= cpu_count:
+        threads = 1
+        while workers * threads <= cpu_count:
+            candidates.append({"workers": workers, "torch_threads": threads})
+            threads *= 2
+        workers *= 2
+    return [candidate for candidate in candidates if candidate["workers"] >= MIN_WORKERS] or candidates
+
+
+def calibrate(transcribe: Callable, set_threads: Callable, audio: Optional[np.ndarray] = None,
+              candidates: Optional[List[Dict]] = None) -> Dict:
+    """
+    Measure transcription throughput for each candidate and save the best.
+
+    Every trial runs `workers` threads that each transcribe the calibration
+    audio AUTOTUNE_ROUNDS times with torch limited to `torch_threads`.
+    Throughput is seconds of audio transcribed per wall-clock second. Nothing
+    else may transcribe meanwhile: the torch thread count is process-wide
+    and concurrent work would skew the measurements. A candidate whose
+    transcriptions fail, e.g. by running out of memory, is left out.
+
+    Returns:
+        dict: The saved result, with the best configuration and every trial
+    """
+    if audio is None:
+        audio = calibration_audio(AUTOTUNE_AUDIO_SECONDS)
+    candidates = candidates or candidate_configs()
+    audio_seconds = len(audio) / 16000
+
+    # Warm up once so model loading and first-call allocations are not measured
+    transcribe(audio)
+
+    trials = []
+    for candidate in candidates:
+        set_threads(candidate["torch_threads"])
+        errors: List[Exception] = []
+        started = time.perf_counter()
+        threads = [
+            threading.Thread(target=_transcribe_rounds, args=(transcribe, audio, AUTOTUNE_ROUNDS, errors))
+            for _ in range(candidate["workers"])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        if errors:
+            logger.warning(f"Autotune trial {candidate} failed, skipping it: {errors[0]}")
+            continue
+        throughput = candidate["workers"] * AUTOTUNE_ROUNDS * audio_seconds / elapsed
+        trials.append({**candidate, "throughput": round(throughput, 3)})
+        logger.info(f"Autotune trial {candidate}: {throughput:.2f}x realtime")
+
+    if not trials:
+        raise RuntimeError("Every autotune trial failed")
+    best = max(trials, key=lambda trial: trial["throughput"])
+    result = {
+        "workers": best["workers"],
+        "torch_threads": best["torch_threads"],
+        "throughput": best["throughput"],
+        "measured_at": datetime.now(timezone.utc).isoformat(),
+        "host": _host(),
+        "trials": trials,
+    }
+    _save(result)
+    return result
+
+
+def calibration_audio(seconds: float) -> np.ndarray:
+    """
+    Speech-like synthetic audio: noise shaped by a syllable-rate envelope.
+
+    The encoder cost does not depend on content, and the envelope keeps
+    the decoder producing tokens instead of detecting silence. Whisper may
+    decode it as repetitive text, so the transcribe callable passed to
+    calibrate() should not retry or cut short such windows.
+    """
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * 16000)) / 16000
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t)) * (0.6 + 0.4 * np.sin(2 * np.pi * 0.3 * t))
+    carrier = np.sin(2 * np.pi * 150 * t) + 0.5 * np.sin(2 * np.pi * 300 * t) + 0.3 * rng.standard_normal(len(t))
+    return (0.1 * envelope * carrier).astype(np.float32)
+
+
+def _transcribe_rounds(transcribe: Callable, audio: np.ndarray, rounds: int, errors: List[Exception]):
+    try:
+        for _ in range(rounds):
+            transcribe(audio)
+    except Exception as e:
+        errors.append(e)
+
+
+def _host() -> Dict:
+    return {
+        "cpu_count": CPU_COUNT,
+        "device": os.getenv("WHISPER_DEVICE", "cpu"),
+        "model": os.getenv("WHISPER_MODEL", "base"),
+    }
+
+
+def _save(result: Dict):
+    if not AUTOTUNE_FILE:
+        return
+    temp_path = f"{AUTOTUNE_FILE}.tmp"
+    with open(temp_path, "w") as autotune_file:
+        json.dump(result, autotune_file, indent=2)
+    os.replace(temp_path, AUTOTUNE_FILE)
+
+
+# Configuration in effect; updated when a calibration is applied
+tuning = resolve_config()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Startup import-time benchmark for TalkVision
+Runs `python -X importtime -c "import app"` and reports the cost per module
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Modules that must only be imported once inference is needed
+HEAVY_MODULES = ["torch", "whisper", "tiktoken", "numba"]
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def project_modules():
+    """Our own top-level modules, taken from the .py files next to this script"""
+    return sorted(name[:-3] for name in os.listdir(PROJECT_DIR) if name.endswith(".py"))
+
+
+def measure_imports(target="app"):
+    """Import the target module in a fresh interpreter and parse -X importtime output"""
+    env = dict(os.environ, PRELOAD_MODEL="false")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True, text=True, env=env, cwd=PROJECT_DIR
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit(f"❌ Failed to import {target}")
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = {
+                "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000,
+                "depth": len(indent) // 2
+            }
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure TalkVision startup import time")
+    parser.add_argument("--target", default="app", help="Module to import (default: app)")
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("STARTUP_BUDGET_MS", 1500)),
+                        help="Fail if importing the target takes longer than this")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest top-level imports to show")
+    args = parser.parse_args()
+
+    print(f"⏱️  Measuring import time of '{args.target}'")
+    print("=" * 50)
+    modules = measure_imports(args.target)
+
+    print("\n📦 Project modules (cumulative):")
+    for name in project_modules():
+        if name in modules:
+            print(f"   {name:<20} {modules[name]['cumulative_ms']:>9.1f} ms")
+
+    print("\n🐢 Slowest top-level imports:")
+    top_level = [(name, info) for name, info in modules.items() if info["depth"] == 0]
+    for name, info in sorted(top_level, key=lambda item: -item[1]["cumulative_ms"])[:args.top]:
+        print(f"   {name:<40} {info['cumulative_ms']:>9.1f} ms")
+
+    failures = []
+    heavy = [name for name in HEAVY_MODULES if name in modules]
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+
+    total_ms = modules.get(args.target, {}).get("cumulative_ms", 0.0)
+    print(f"\n⏱️  Total: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms exceeds budget of {args.budget_ms:.0f} ms")
+
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        return 1
+
+    print("✅ Startup import time is within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
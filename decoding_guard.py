@@ -0,0 +1,203 @@
+# decoding_guard.py
+import dataclasses
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from window_tracking import current_window_seek
+
+GUARD_ENABLED = os.getenv("GUARD_ENABLED", "true").lower() == "true"
+# A phrase repeated this many times back to back ends the window...
+GUARD_REPEATS = int(os.getenv("GUARD_REPEATS", 4))
+# ...or this many times when the model already thinks the window has no speech
+GUARD_REPEATS_NO_SPEECH = int(os.getenv("GUARD_REPEATS_NO_SPEECH", 2))
+GUARD_NO_SPEECH_THRESHOLD = float(os.getenv("GUARD_NO_SPEECH_THRESHOLD", 0.6))
+# Longest repeated phrase looked for, and the shortest run worth acting on, in tokens
+GUARD_MAX_PERIOD = int(os.getenv("GUARD_MAX_PERIOD", 12))
+GUARD_MIN_RUN_TOKENS = int(os.getenv("GUARD_MIN_RUN_TOKENS", 8))
+# Same threshold model.transcribe uses for its fallback, applied while decoding
+GUARD_COMPRESSION_RATIO = float(os.getenv("GUARD_COMPRESSION_RATIO", 2.4))
+GUARD_COMPRESSION_MIN_TOKENS = 48
+GUARD_COMPRESSION_INTERVAL = 8
+
+_state = threading.local()
+
+
+class RunawayGuard:
+    """
+    Logit filter that ends a window as soon as decoding starts looping.
+
+    Runs after Whisper's own filters at every decoding step. When a row's
+    text ends in a phrase repeated back to back, or the text so far
+    compresses too well, only end-of-text is left possible for that row so
+    decoding stops there instead of running to the token limit. Where the
+    runaway text starts is remembered so only that part is suppressed.
+    """
+
+    def __init__(self, tokenizer, sample_begin: int, trips: Dict[int, Dict]):
+        self.tokenizer = tokenizer
+        self.sample_begin = sample_begin
+        self.trips = trips
+        self.seek = current_window_seek()
+        self.no_speech_probs: Optional[List[float]] = None
+        self.tripped: List[Dict] = []
+        # A retry of the same window starts with a clean slate
+        self.trips.pop(self.seek, None)
+
+    def apply(self, logits, tokens):
+        eot = self.tokenizer.eot
+        for row, sequence in enumerate(tokens[:, self.sample_begin:].tolist()):
+            if sequence and sequence[-1] == eot:
+                continue
+            # Special and timestamp tokens all sort after end-of-text
+            text_tokens = [token for token in sequence if token < eot]
+            trip = self._detect(row, text_tokens)
+            if trip:
+                logits[row, :] = float("-inf")
+                logits[row, eot] = 0.0
+                reason, start_token = trip
+                self.tripped.append({"reason": reason, "start_token": start_token, "text_tokens": text_tokens})
+
+    def settle(self, results: list) -> list:
+        """
+        Record the trip of every result that was cut short, and make it fail
+        model.transcribe's compression-ratio check so the window is retried
+        at a higher temperature. Only the last attempt's trip is kept.
+        """
+        settled = []
+        for result in results:
+            text_tokens = [token for token in result.tokens if token < self.tokenizer.eot]
+            trip = next((trip for trip in self.tripped if trip["text_tokens"] == text_tokens), None)
+            if trip:
+                self.trips[self.seek] = {
+                    "reason": trip["reason"],
+                    "start_token": trip["start_token"],
+                    "eot": self.tokenizer.eot,
+                }
+                result = dataclasses.replace(result, compression_ratio=float("inf"))
+            settled.append(result)
+        return settled
+
+    def _detect(self, row: int, text_tokens: List[int]) -> Optional[Tuple[str, int]]:
+        no_speech = self.no_speech_probs is not None and self.no_speech_probs[row] > GUARD_NO_SPEECH_THRESHOLD
+        repeats = GUARD_REPEATS_NO_SPEECH if no_speech else GUARD_REPEATS
+        start = _repetition_start(text_tokens, repeats)
+        if start is not None:
+            return "repetition", start
+
+        count = len(text_tokens)
+        if count >= GUARD_COMPRESSION_MIN_TOKENS and count % GUARD_COMPRESSION_INTERVAL == 0:
+            if self._compression_ratio(text_tokens) > GUARD_COMPRESSION_RATIO:
+                return "compression_ratio", self._compressible_start(text_tokens)
+        return None
+
+    def _compression_ratio(self, text_tokens: List[int]) -> float:
+        text = self.tokenizer.decode(text_tokens).encode("utf-8")
+        return len(text) / len(zlib.compress(text))
+
+    def _compressible_start(self, text_tokens: List[int]) -> int:
+        """Token where the repetitive tail starts: the suffix that compresses best."""
+        # Only runs once per trip, so every start position can be tried
+        starts = range(0, len(text_tokens) - GUARD_COMPRESSION_MIN_TOKENS + 1)
+        return max(starts, key=lambda start: (self._compression_ratio(text_tokens[start:]), -start))
+
+
+def _repetition_start(tokens: List[int], repeats: int) -> Optional[int]:
+    """
+    If the sequence ends with some phrase repeated `repeats` times in a row,
+    the index where that run of repeats begins.
+    """
+    for period in range(1, GUARD_MAX_PERIOD + 1):
+        run = period * repeats
+        if run < GUARD_MIN_RUN_TOKENS:
+            continue
+        if run > len(tokens):
+            break
+        tail = tokens[-run:]
+        if tail == tail[:period] * repeats:
+            start = len(tokens) - run
+            # Include earlier copies of the phrase
+            while start >= period and tokens[start - period:start] == tail[:period]:
+                start -= period
+            return start
+    return None
+
+
+def install_decoding_guard():
+    """Add RunawayGuard to every DecodingTask created inside guard_decoding()."""
+    from whisper.decoding import DecodingTask
+
+    task_init = DecodingTask.__init__
+    task_run = DecodingTask.run
+
+    def guarded_init(task, model, options):
+        task_init(task, model, options)
+        task.runaway_guard = None
+        trips = getattr(_state, "trips", None)
+        if trips is None:
+            return
+
+        guard = RunawayGuard(task.tokenizer, task.sample_begin, trips)
+        task.logit_filters.append(guard)
+        task.runaway_guard = guard
+
+        # The filters only see last-position logits, so read the no-speech
+        # probability off the first forward pass the same way _main_loop does
+        logits = task.inference.logits
+
+        def logits_with_no_speech(tokens, audio_features):
+            output = logits(tokens, audio_features)
+            if guard.no_speech_probs is None and task.tokenizer.no_speech is not None:
+                probs_at_sot = output[:, task.sot_index].float().softmax(dim=-1)
+                guard.no_speech_probs = probs_at_sot[:, task.tokenizer.no_speech].tolist()
+            return output
+
+        task.inference.logits = logits_with_no_speech
+
+    def guarded_run(task, mel):
+        results = task_run(task, mel)
+        if task.runaway_guard is None:
+            return results
+        return task.runaway_guard.settle(results)
+
+    DecodingTask.__init__ = guarded_init
+    DecodingTask.run = guarded_run
+
+
+@contextmanager
+def guard_decoding():
+    """
+    Guard decoding on this thread.
+
+    Yields a dict filled with {window seek: {"reason", "start_token", "eot"}}
+    for every window whose final decoding attempt was cut short, where
+    start_token counts the window's text tokens (those below eot) before
+    the runaway part.
+    """
+    if not GUARD_ENABLED:
+        yield {}
+        return
+    _state.trips = {}
+    try:
+        yield _state.trips
+    finally:
+        _state.trips = None
+
+
+def mark_suppressed(segments: List[Dict], trips: Dict[int, Dict]) -> List[Dict]:
+    """Flag the segments that contain runaway text from a guarded window."""
+    decoded = {}
+    for segment in segments:
+        trip = trips.get(segment.get("seek"))
+        if not trip:
+            continue
+        # Segments of a window split its tokens in order, so count text tokens up to this one
+        first_token = decoded.get(segment["seek"], 0)
+        text_tokens = sum(1 for token in segment.get("tokens", []) if token < trip["eot"])
+        decoded[segment["seek"]] = first_token + text_tokens
+        if first_token + text_tokens > trip["start_token"]:
+            segment["suppressed"] = True
+            segment["suppressed_reason"] = trip["reason"]
+    return segments
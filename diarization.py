@@ -0,0 +1,147 @@
+# diarization.py
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, List
+
+import numpy as np
+
+from window_tracking import current_window_seek
+
+# Cosine similarity above which two speaker clusters are merged
+DIARIZATION_THRESHOLD = float(os.getenv("DIARIZATION_THRESHOLD", 0.5))
+DIARIZATION_MAX_SPEAKERS = int(os.getenv("DIARIZATION_MAX_SPEAKERS", 8))
+# Frames quieter than this many dB below the loudest frame are treated as non-speech
+DIARIZATION_VAD_RANGE_DB = float(os.getenv("DIARIZATION_VAD_RANGE_DB", 35))
+
+SAMPLE_RATE = 16000
+# Each encoder output frame covers 20 ms (two 10 ms mel frames)
+ENCODER_FRAME_SECONDS = 0.02
+MEL_FRAMES_PER_SECOND = 100
+
+_capture = threading.local()
+
+
+def install_encoder_capture(model):
+    """
+    Let transcriptions record the encoder outputs they already compute.
+
+    Each output is filed under the window it was computed for. Nothing is
+    stored unless the calling thread is inside capture_encoder_outputs().
+    """
+    def capture_hook(module, inputs, output):
+        features = getattr(_capture, "features", None)
+        seek = current_window_seek()
+        if features is not None:
+            # Keep the last encoding of each window: language detection encodes
+            # window 0 padded differently before the window itself is decoded,
+            # and fallback retries re-encode the same input
+            features[seek] = output[0].detach().float().cpu().numpy()
+
+    model.encoder.register_forward_hook(capture_hook)
+
+
+@contextmanager
+def capture_encoder_outputs():
+    """Collect encoder outputs computed on this thread, keyed by window seek in mel frames."""
+    _capture.features = {}
+    try:
+        yield _capture.features
+    finally:
+        _capture.features = None
+
+
+def assign_speakers(audio: np.ndarray, segments: List[Dict], features: Dict[int, np.ndarray]) -> List[Dict]:
+    """
+    Label each segment with a speaker by clustering encoder embeddings.
+
+    Each segment is embedded as the mean encoder output over its speech
+    frames, using the window the segment was decoded from. Segments are
+    then grouped by average-linkage clustering on cosine similarity.
+
+    Returns:
+        list: The same segments with a "speaker" key added
+    """
+    speech = _speech_frames(audio)
+    embeddings, indices = [], []
+    for index, segment in enumerate(segments):
+        embedding = _segment_embedding(segment, features, speech)
+        if embedding is not None:
+            embeddings.append(embedding)
+            indices.append(index)
+
+    for segment in segments:
+        segment["speaker"] = None
+    if not embeddings:
+        return segments
+
+    labels = _cluster(np.stack(embeddings))
+    # Number speakers in order of first appearance
+    names = {}
+    for index, label in zip(indices, labels):
+        names.setdefault(label, f"SPEAKER_{len(names) + 1}")
+        segments[index]["speaker"] = names[label]
+    return segments
+
+
+def _speech_frames(audio: np.ndarray) -> np.ndarray:
+    """Energy-based VAD over 20 ms frames."""
+    frame_length = int(SAMPLE_RATE * ENCODER_FRAME_SECONDS)
+    n_frames = len(audio) // frame_length
+    if n_frames == 0:
+        return np.zeros(0, dtype=bool)
+    frames = audio[:n_frames * frame_length].reshape(n_frames, frame_length)
+    energy_db = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+    return energy_db > max(energy_db.max() - DIARIZATION_VAD_RANGE_DB, -60.0)
+
+
+def _segment_embedding(segment: Dict, features: Dict[int, np.ndarray], speech: np.ndarray):
+    window = features.get(segment.get("seek"))
+    if window is None:
+        return None
+
+    window_start = segment["seek"] / MEL_FRAMES_PER_SECOND
+    first = max(0, int((segment["start"] - window_start) / ENCODER_FRAME_SECONDS))
+    last = min(len(window), int(np.ceil((segment["end"] - window_start) / ENCODER_FRAME_SECONDS)))
+    if last <= first:
+        return None
+
+    frames = window[first:last]
+    # Restrict to VAD speech frames, using the whole segment if none are voiced
+    offset = int(window_start / ENCODER_FRAME_SECONDS) + first
+    voiced = speech[offset:offset + len(frames)]
+    if voiced.any():
+        frames = frames[:len(voiced)][voiced]
+    return frames.mean(axis=0)
+
+
+def _cluster(embeddings: np.ndarray) -> List[int]:
+    """Average-linkage agglomerative clustering on cosine similarity."""
+    embeddings = embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-8)
+
+    clusters = [[i] for i in range(len(embeddings))]
+    similarity = embeddings @ embeddings.T
+    np.fill_diagonal(similarity, -np.inf)
+    sizes = np.ones(len(clusters))
+
+    while len(clusters) > 1:
+        i, j = np.unravel_index(np.argmax(similarity), similarity.shape)
+        if similarity[i, j] < DIARIZATION_THRESHOLD and len(clusters) <= DIARIZATION_MAX_SPEAKERS:
+            break
+        # Merge j into i; the average-linkage similarity is the size-weighted mean
+        merged = (similarity[i] * sizes[i] + similarity[j] * sizes[j]) / (sizes[i] + sizes[j])
+        similarity[i, :] = merged
+        similarity[:, i] = merged
+        similarity[i, i] = -np.inf
+        sizes[i] += sizes[j]
+        clusters[i].extend(clusters[j])
+
+        similarity = np.delete(np.delete(similarity, j, axis=0), j, axis=1)
+        sizes = np.delete(sizes, j)
+        del clusters[j]
+
+    labels = [0] * len(embeddings)
+    for label, members in enumerate(clusters):
+        for member in members:
+            labels[member] = label
+    return labels
@@ -0,0 +1,116 @@
+# lifecycle.py
+import asyncio
+import glob
+import logging
+import os
+import signal
+import tempfile
+import time
+
+logger = logging.getLogger(__name__)
+
+# Longest time in-flight transcriptions get to finish after SIGTERM
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", 30))
+# Where uploads are written; files are named talkvision-<pid>-*
+TEMP_AUDIO_DIR = os.getenv("TEMP_AUDIO_DIR", tempfile.gettempdir())
+TEMP_AUDIO_PREFIX = "talkvision-"
+
+
+class DrainController:
+    """
+    Tracks in-flight work and lets the process drain it before exiting.
+
+    On SIGTERM the controller flips to draining, waits until no request is
+    in flight or DRAIN_TIMEOUT has passed, and only then hands the signal
+    to the server's own handler so it can shut down.
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.draining = False
+        self.in_flight = 0
+        self._server_handler = None
+        self._drain_task = None
+
+    def start(self):
+        self.in_flight += 1
+
+    def finish(self):
+        self.in_flight -= 1
+
+    def install_signal_handler(self):
+        """Put the drain in front of the server's SIGTERM handler. Must run on the event loop."""
+        loop = asyncio.get_running_loop()
+        self._server_handler = signal.getsignal(signal.SIGTERM)
+
+        def handle_sigterm(signum, frame):
+            if self.draining:
+                return
+            self.draining = True
+            loop.call_soon_threadsafe(self._start_drain, signum, frame)
+
+        try:
+            signal.signal(signal.SIGTERM, handle_sigterm)
+        except ValueError:
+            # Signal handlers can only be installed from the main thread
+            logger.warning("Not running in the main thread, SIGTERM will not drain requests")
+
+    def _start_drain(self, signum, frame):
+        self._drain_task = asyncio.get_running_loop().create_task(self.drain(signum, frame))
+
+    async def drain(self, signum=signal.SIGTERM, frame=None):
+        self.draining = True
+        logger.info(f"Draining {self.in_flight} in-flight request(s), deadline {self.timeout}s")
+        deadline = time.monotonic() + self.timeout
+        while self.in_flight > 0 and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.in_flight > 0:
+            logger.warning(f"Drain deadline reached with {self.in_flight} request(s) still running")
+        else:
+            logger.info("Drain complete")
+
+        if callable(self._server_handler):
+            self._server_handler(signum, frame)
+        elif self._server_handler == signal.SIG_DFL:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            os.kill(os.getpid(), signal.SIGTERM)
+
+
+def temp_audio_prefix() -> str:
+    """Prefix for temporary upload files, tagged with this process's PID."""
+    return f"{TEMP_AUDIO_PREFIX}{os.getpid()}-"
+
+
+def sweep_temp_audio() -> int:
+    """
+    Delete temporary uploads left behind by processes that are no longer running.
+
+    Returns:
+        int: Number of files removed
+    """
+    removed = 0
+    for path in glob.glob(os.path.join(TEMP_AUDIO_DIR, f"{TEMP_AUDIO_PREFIX}*")):
+        pid = os.path.basename(path)[len(TEMP_AUDIO_PREFIX):].split("-", 1)[0]
+        if not pid.isdigit() or _process_alive(int(pid)):
+            continue
+        try:
+            os.unlink(path)
+            removed += 1
+        except OSError as e:
+            logger.warning(f"Failed to remove leftover temp file {path}: {e}")
+    return removed
+
+
+def _process_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+drain = DrainController(DRAIN_TIMEOUT)
@@ -0,0 +1,245 @@
+# profiling.py
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+# Opt-in: spans are only recorded when PROFILING_ENABLED is true
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# "file" writes OpenTelemetry-style JSON lines, "otlp" exports to a collector
+PROFILING_EXPORTER = os.getenv("PROFILING_EXPORTER", "file")
+PROFILING_TRACE_FILE = os.getenv("PROFILING_TRACE_FILE", "traces.jsonl")
+# Interval of the built-in stack sampler used when py-spy is unavailable
+PROFILING_SAMPLE_INTERVAL = float(os.getenv("PROFILING_SAMPLE_INTERVAL", 0.005))
+MAX_PROFILE_SECONDS = 60
+# Finished spans waiting to be written; spans are dropped while it is full
+PROFILING_QUEUE_SIZE = int(os.getenv("PROFILING_QUEUE_SIZE", 10000))
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_otel_tracer = None
+
+
+class _Span:
+    """A finished span is written as one OpenTelemetry-style JSON line."""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_span_id", "start", "attributes")
+
+    def __init__(self, name: str, parent, attributes: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else ""
+        self.start = time.time_ns()
+        self.attributes = dict(attributes)
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def export(self, error: str = None):
+        record = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_span_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start,
+            "endTimeUnixNano": time.time_ns(),
+            "attributes": self.attributes,
+            "status": {"code": "ERROR", "message": error} if error else {"code": "OK"},
+        }
+        _writer.submit(record)
+
+
+class _SpanWriter:
+    """
+    Appends finished spans to the trace file from a background thread.
+
+    Spans often end on the event loop, so export only queues the record,
+    like BatchSpanProcessor does on the OTLP path. The writer drains
+    whatever has queued up and appends it in one write.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str, max_queued: int):
+        self.path = path
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, record: dict):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="span-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def close(self, timeout: float = 5.0):
+        """Write out the queued spans and stop the writer."""
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            records = [self._queue.get()]
+            while len(records) < 1000:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = self._STOP in records
+            lines = [json.dumps(record, default=str) + "\n" for record in records if record is not self._STOP]
+            if self.dropped:
+                logger.warning(f"Trace queue full, dropped {self.dropped} span(s)")
+                self.dropped = 0
+            try:
+                with open(self.path, "a") as trace_file:
+                    trace_file.writelines(lines)
+            except OSError as e:
+                logger.warning(f"Failed to write spans to {self.path}: {e}")
+            if stop:
+                return
+
+
+_writer = _SpanWriter(PROFILING_TRACE_FILE, PROFILING_QUEUE_SIZE)
+
+
+class _NoopSpan:
+    def set_attribute(self, key: str, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _setup_otel():
+    """Return an OpenTelemetry tracer exporting over OTLP, or None if unavailable."""
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("OpenTelemetry packages not installed, writing spans to %s", PROFILING_TRACE_FILE)
+        return None
+
+    # The collector endpoint comes from the standard OTEL_EXPORTER_OTLP_* variables
+    provider = TracerProvider(resource=Resource.create({"service.name": "talkvision"}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    return trace.get_tracer("talkvision")
+
+
+if PROFILING_ENABLED and PROFILING_EXPORTER == "otlp":
+    _otel_tracer = _setup_otel()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Record a timed span around a block, nested under the current span.
+
+    Does nothing unless PROFILING_ENABLED is true. The current span is kept in
+    a context variable, so spans follow the request across awaits and into
+    worker threads that run with a copied context.
+    """
+    if not PROFILING_ENABLED:
+        yield _NOOP_SPAN
+        return
+
+    if _otel_tracer is not None:
+        with _otel_tracer.start_as_current_span(name, attributes=attributes) as otel_span:
+            yield otel_span
+        return
+
+    current = _Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        error = str(e) or type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        current.export(error)
+
+
+def capture_flamegraph(seconds: float) -> Tuple[bytes, str]:
+    """
+    Profile the whole live process for a time window.
+
+    Uses py-spy when it is installed and allowed to attach, which yields an
+    SVG flamegraph. Otherwise samples the stacks of all threads in-process
+    and returns them in folded format, ready for flamegraph.pl or speedscope.
+
+    Returns:
+        tuple: (profile content, media type)
+    """
+    seconds = max(1.0, min(seconds, MAX_PROFILE_SECONDS))
+    if shutil.which("py-spy"):
+        svg = _capture_py_spy(seconds)
+        if svg is not None:
+            return svg, "image/svg+xml"
+    return _sample_stacks(seconds).encode(), "text/plain"
+
+
+def _capture_py_spy(seconds: float):
+    fd, output_path = tempfile.mkstemp(suffix=".svg")
+    os.close(fd)
+    try:
+        subprocess.run(
+            ["py-spy", "record", "--pid", str(os.getpid()), "--duration", str(int(seconds)),
+             "--format", "flamegraph", "--output", output_path, "--nonblocking"],
+            check=True, capture_output=True, timeout=seconds + 30,
+        )
+        with open(output_path, "rb") as svg_file:
+            return svg_file.read()
+    except (subprocess.SubprocessError, OSError) as e:
+        logger.warning(f"py-spy capture failed, falling back to built-in sampler: {e}")
+        return None
+    finally:
+        if os.path.exists(output_path):
+            os.unlink(output_path)
+
+
+def _sample_stacks(seconds: float) -> str:
+    own_thread = threading.get_ident()
+    counts = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(PROFILING_SAMPLE_INTERVAL)
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common())
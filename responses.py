@@ -0,0 +1,148 @@
+# responses.py
+import array
+import gzip
+import os
+import sys
+from typing import Dict, List, Tuple
+
+from fastapi import Request
+from fastapi.responses import JSONResponse, Response
+
+# Optional fast encoders; the standard library is used when they are missing
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Responses smaller than this are not worth compressing
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", 5))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", 3))
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+COLUMNAR_JSON = "application/vnd.talkvision.columnar+json"
+COLUMNAR_MSGPACK = "application/vnd.talkvision.columnar+msgpack"
+
+_MEDIA_TYPE_ALIASES = {"application/x-msgpack": MSGPACK}
+_SEGMENT_FIELDS = ("start", "end", "text", "translation", "speaker", "suppressed")
+
+if orjson is not None:
+    class FastJSONResponse(JSONResponse):
+        """JSONResponse rendered with orjson."""
+
+        def render(self, content) -> bytes:
+            return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+else:
+    FastJSONResponse = JSONResponse
+
+
+def encode_response(request: Request, payload: Dict) -> Response:
+    """
+    Encode a transcription payload in the format the client asked for.
+
+    The Accept header selects row-oriented JSON (default), msgpack, or a
+    columnar layout where segments become parallel start/end/text arrays.
+    Large bodies are compressed with zstd or gzip according to
+    Accept-Encoding.
+    """
+    media_type = _negotiate_media_type(request.headers.get("accept", ""))
+    if media_type in (COLUMNAR_JSON, COLUMNAR_MSGPACK):
+        payload = _to_columnar(payload, packed=media_type == COLUMNAR_MSGPACK)
+
+    if media_type in (MSGPACK, COLUMNAR_MSGPACK):
+        body = msgpack.packb(payload, use_bin_type=True)
+    else:
+        body = FastJSONResponse(payload).body
+
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        body, encoding = _compress(body, request.headers.get("accept-encoding", ""))
+        if encoding:
+            headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def _negotiate_media_type(accept: str) -> str:
+    """Pick the supported media type with the highest q-value, the first listed on a tie."""
+    for media_type, _ in _preferences(accept):
+        media_type = _MEDIA_TYPE_ALIASES.get(media_type, media_type)
+        if media_type in (MSGPACK, COLUMNAR_MSGPACK) and msgpack is None:
+            continue
+        if media_type in (JSON, MSGPACK, COLUMNAR_JSON, COLUMNAR_MSGPACK):
+            return media_type
+    return JSON
+
+
+def _preferences(header: str) -> List[Tuple[str, float]]:
+    """
+    Values of an Accept-style header with their q-values, most preferred first.
+
+    Values with q=0 are refused by the client and left out; a missing or
+    malformed q-value counts as 1.
+    """
+    preferences = []
+    for part in header.split(","):
+        value, *params = part.split(";")
+        value = value.strip().lower()
+        if not value:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, number = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    pass
+        if q > 0:
+            preferences.append((value, q))
+    # sorted is stable, so equally preferred values keep their listed order
+    return sorted(preferences, key=lambda preference: -preference[1])
+
+
+def _to_columnar(payload: Dict, packed: bool) -> Dict:
+    """
+    Replace the segment list with one array per field.
+
+    With packed=True the timestamps are little-endian float32 byte strings,
+    which msgpack stores as raw binary.
+    """
+    segments = payload.get("segments")
+    if segments is None:
+        return payload
+
+    columns = {}
+    for field in _SEGMENT_FIELDS:
+        if not any(field in segment for segment in segments):
+            continue
+        values = [segment.get(field) for segment in segments]
+        if packed and field in ("start", "end"):
+            packed_values = array.array("f", values)
+            if sys.byteorder != "little":
+                packed_values.byteswap()
+            values = packed_values.tobytes()
+        columns[field] = values
+    return {**payload, "segments": columns}
+
+
+def _compress(body: bytes, accept_encoding: str):
+    encodings = dict(_preferences(accept_encoding))
+    zstd_q = encodings.get("zstd", 0) if zstandard is not None else 0
+    gzip_q = encodings.get("gzip", 0)
+    # zstd is preferred when the client accepts both equally
+    if zstd_q and zstd_q >= gzip_q:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body), "zstd"
+    if gzip_q:
+        return gzip.compress(body, compresslevel=GZIP_LEVEL), "gzip"
+    return body, None
@@ -0,0 +1,194 @@
+# scheduler.py
+import asyncio
+import contextlib
+import contextvars
+import functools
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict
+
+from autotune import LIVE_RESERVED_WORKERS, tuning
+from profiling import span
+
+# Request lanes, highest priority first
+LANES = ("live", "batch")
+
+# Total number of concurrent transcriptions (TRANSCRIBE_WORKERS, the autotuned
+# value, or one more than LIVE_RESERVED_WORKERS) and the share reserved for
+# live captions. Workers share the model; whisper_model scopes its decoder
+# KV cache to the calling thread so concurrent decodes stay independent.
+WORKERS = tuning["workers"]
+# Queue-wait target for the live lane, in seconds
+LIVE_QUEUE_SLO = float(os.getenv("LIVE_QUEUE_SLO", 1.0))
+# Number of recent queue waits kept per lane for the statistics
+STATS_WINDOW = int(os.getenv("SCHEDULER_STATS_WINDOW", 500))
+# Processing seconds per second of audio assumed until real requests are measured
+INITIAL_REALTIME_FACTOR = float(os.getenv("INITIAL_REALTIME_FACTOR", 0.5))
+
+
+class PriorityScheduler:
+    """
+    Run blocking transcription calls on a worker pool with two priority lanes.
+
+    Live requests may use any free worker and always start before waiting
+    batch requests. Batch requests only start when no live request is waiting
+    and never occupy the workers reserved for the live lane, so they soak up
+    leftover capacity without delaying captions. Running work is never
+    interrupted; batch work is preempted at admission time.
+    """
+
+    def __init__(self, workers: int, live_reserved: int, live_slo: float):
+        self.workers = workers
+        self.requested_live_reserved = live_reserved
+        # Always leave at least one worker usable by batch work
+        self.live_reserved = max(0, min(live_reserved, workers - 1))
+        self.live_slo = live_slo
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcribe")
+        self._cond = None
+        self._held = False
+        self._running = {lane: 0 for lane in LANES}
+        self._waiting = {lane: 0 for lane in LANES}
+        self._completed = {lane: 0 for lane in LANES}
+        self._slo_violations = {lane: 0 for lane in LANES}
+        self._waits = {lane: deque(maxlen=STATS_WINDOW) for lane in LANES}
+        self.realtime_factor = INITIAL_REALTIME_FACTOR
+
+    def _condition(self) -> asyncio.Condition:
+        # Created lazily so it binds to the server's running event loop
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    def _can_start(self, lane: str) -> bool:
+        if self._held or sum(self._running.values()) >= self.workers:
+            return False
+        if lane == "live":
+            return True
+        if self._waiting["live"]:
+            return False
+        return self._running["batch"] < self.workers - self.live_reserved
+
+    async def run(self, lane: str, func: Callable, *args, **kwargs):
+        """
+        Wait for a worker in the given lane, then run func(*args, **kwargs) on it.
+
+        Returns:
+            tuple: (result of func, queue wait in seconds)
+        """
+        if lane not in LANES:
+            raise ValueError(f"Unknown lane '{lane}'. Expected one of: {', '.join(LANES)}")
+
+        cond = self._condition()
+        enqueued = time.perf_counter()
+        with span("queue_wait", lane=lane):
+            async with cond:
+                self._waiting[lane] += 1
+                try:
+                    await cond.wait_for(lambda: self._can_start(lane))
+                finally:
+                    self._waiting[lane] -= 1
+                    cond.notify_all()
+                self._running[lane] += 1
+
+        wait = time.perf_counter() - enqueued
+        self._waits[lane].append(wait)
+        if lane == "live" and wait > self.live_slo:
+            self._slo_violations[lane] += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+            # Run with a copy of the caller's context so profiling spans nest under the request
+            context = contextvars.copy_context()
+            call = functools.partial(context.run, func, *args, **kwargs)
+            result = await loop.run_in_executor(self._executor, call)
+            return result, wait
+        finally:
+            async with cond:
+                self._running[lane] -= 1
+                self._completed[lane] += 1
+                cond.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def hold(self):
+        """
+        Stop starting work and wait until running work has finished.
+
+        Waiting requests start again once the block exits.
+        """
+        cond = self._condition()
+        async with cond:
+            self._held = True
+            await cond.wait_for(lambda: sum(self._running.values()) == 0)
+        try:
+            yield
+        finally:
+            async with cond:
+                self._held = False
+                cond.notify_all()
+
+    async def resize(self, workers: int):
+        """
+        Change the number of concurrent transcriptions.
+
+        Running calls finish on the old pool; new calls start on a pool of
+        the new size, and waiting requests are admitted if it grew.
+        """
+        previous = self._executor
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcribe")
+        previous.shutdown(wait=False)
+        cond = self._condition()
+        async with cond:
+            self.workers = workers
+            self.live_reserved = max(0, min(self.requested_live_reserved, workers - 1))
+            cond.notify_all()
+
+    def observe_processing(self, audio_seconds: float, processing_seconds: float):
+        """Fold a finished transcription into the moving realtime-factor estimate."""
+        if audio_seconds > 0:
+            self.realtime_factor += 0.2 * (processing_seconds / audio_seconds - self.realtime_factor)
+
+    def estimate_processing(self, audio_seconds: float) -> float:
+        """Expected processing time for audio of the given length, in seconds."""
+        return audio_seconds * self.realtime_factor
+
+    def stats(self) -> Dict:
+        """Per-lane queue depth and queue-wait statistics in milliseconds."""
+        lanes = {}
+        for lane in LANES:
+            waits = sorted(self._waits[lane])
+            lanes[lane] = {
+                "waiting": self._waiting[lane],
+                "running": self._running[lane],
+                "completed": self._completed[lane],
+                "queue_wait_ms": {
+                    "avg": _ms(sum(waits) / len(waits)) if waits else 0.0,
+                    "p50": _ms(_percentile(waits, 0.50)),
+                    "p95": _ms(_percentile(waits, 0.95)),
+                    "max": _ms(waits[-1]) if waits else 0.0,
+                },
+            }
+        lanes["live"]["slo_ms"] = _ms(self.live_slo)
+        lanes["live"]["slo_violations"] = self._slo_violations["live"]
+        return {
+            "workers": self.workers,
+            "live_reserved_workers": self.live_reserved,
+            "realtime_factor": round(self.realtime_factor, 4),
+            "lanes": lanes,
+        }
+
+
+def _percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+scheduler = PriorityScheduler(WORKERS, LIVE_RESERVED_WORKERS, LIVE_QUEUE_SLO)
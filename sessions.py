@@ -0,0 +1,165 @@
+# sessions.py
+import asyncio
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from whisper_model import SAMPLE_RATE, load_audio, transcribe_audio
+
+# Idle sessions are dropped after this many seconds
+SESSION_TTL = int(os.getenv("SESSION_TTL", 600))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", 100))
+# Unfinalized audio is force-finalized once it grows past this many seconds
+MAX_PENDING_SECONDS = float(os.getenv("SESSION_MAX_PENDING_SECONDS", 30))
+# Characters of finalized transcript passed to the decoder as initial_prompt
+PROMPT_CHARS = int(os.getenv("SESSION_PROMPT_CHARS", 200))
+
+
+class TranscriptionSession:
+    """
+    Incremental transcript of a growing recording.
+
+    Only the unfinalized tail of the recording is kept as audio. Every update
+    re-transcribes that tail with the finalized text as decoder context, then
+    finalizes all segments except the last one, which may still be cut off
+    mid-word. The cost of an update therefore scales with the new audio
+    rather than with the whole recording.
+    """
+
+    def __init__(self, session_id: str, tenant: Optional[str] = None):
+        self.session_id = session_id
+        self.tenant = tenant
+        self.lock = asyncio.Lock()
+        self.pending = np.zeros(0, dtype=np.float32)
+        # Seconds of audio before the pending tail
+        self.offset = 0.0
+        self.segments: List[Dict] = []
+        self.provisional: Optional[Dict] = None
+        self.language: Optional[str] = None
+        self.last_access = time.time()
+
+    @property
+    def text(self) -> str:
+        return " ".join(
+            segment["text"] for segment in self.segments if segment["text"] and not segment.get("suppressed")
+        )
+
+    def _prompt(self) -> Optional[str]:
+        text = self.text
+        return text[-PROMPT_CHARS:] if text else None
+
+    def append(self, file_path: str) -> Dict:
+        """
+        Decode an appended audio chunk and transcribe the pending tail.
+
+        Returns:
+            dict: Newly finalized segments and the provisional tail text
+        """
+        chunk = load_audio(file_path)
+        # Only keep the chunk once it has been transcribed, so a retried update does not add it twice
+        pending = np.concatenate([self.pending, chunk])
+        result = transcribe_audio(pending, language=self.language, initial_prompt=self._prompt(),
+                                  tenant=self.tenant)
+        self.pending = pending
+        if self.language is None and result["language"] != "unknown":
+            # Skip language detection on later updates
+            self.language = result["language"]
+
+        pending_seconds = len(self.pending) / SAMPLE_RATE
+        segments = result["segments"]
+        if pending_seconds >= MAX_PENDING_SECONDS:
+            final, tail = segments, None
+            cut = pending_seconds
+        else:
+            final, tail = segments[:-1], (segments[-1] if segments else None)
+            cut = min(final[-1]["end"], pending_seconds) if final else 0.0
+
+        new_segments = [self._shift(segment) for segment in final]
+        self.segments.extend(new_segments)
+        self.provisional = self._shift(tail) if tail else None
+        self.pending = self.pending[int(cut * SAMPLE_RATE):]
+        self.offset += cut
+
+        return {
+            "new_segments": new_segments,
+            "provisional_text": self._provisional_text(),
+            "language": result["language"],
+            "confidence": result["confidence"],
+            "chunk_seconds": round(len(chunk) / SAMPLE_RATE, 3),
+            "transcribed_seconds": round(pending_seconds, 3),
+        }
+
+    def close(self) -> Dict:
+        """Finalize the provisional tail and return the full transcript."""
+        if self.provisional:
+            self.segments.append(self.provisional)
+            self.provisional = None
+        return {
+            "session_id": self.session_id,
+            "transcript": self.text,
+            "segments": self.segments,
+            "language": self.language or "unknown",
+        }
+
+    def summary(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "transcript": self.text,
+            "provisional_text": self._provisional_text(),
+            "finalized_seconds": round(self.offset, 3),
+            "pending_seconds": round(len(self.pending) / SAMPLE_RATE, 3),
+        }
+
+    def _provisional_text(self) -> str:
+        if self.provisional is None or self.provisional.get("suppressed"):
+            return ""
+        return self.provisional["text"]
+
+    def _shift(self, segment: Dict) -> Dict:
+        shifted = {
+            "start": round(segment["start"] + self.offset, 3),
+            "end": round(segment["end"] + self.offset, 3),
+            "text": segment["text"].strip(),
+        }
+        if segment.get("suppressed"):
+            shifted["suppressed"] = True
+        return shifted
+
+
+class SessionStore:
+    """In-memory registry of live transcription sessions."""
+
+    def __init__(self, ttl: int, max_sessions: int):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: Dict[str, TranscriptionSession] = {}
+
+    def get_or_create(self, session_id: str, tenant: Optional[str] = None) -> Optional[TranscriptionSession]:
+        """Return the session, creating it if needed; None if the store is full."""
+        self._expire()
+        session = self._sessions.get(session_id)
+        if session is None:
+            if len(self._sessions) >= self.max_sessions:
+                return None
+            session = TranscriptionSession(session_id, tenant)
+            self._sessions[session_id] = session
+        session.last_access = time.time()
+        return session
+
+    def get(self, session_id: str) -> Optional[TranscriptionSession]:
+        self._expire()
+        return self._sessions.get(session_id)
+
+    def pop(self, session_id: str) -> Optional[TranscriptionSession]:
+        return self._sessions.pop(session_id, None)
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for session_id, session in list(self._sessions.items()):
+            if session.last_access < cutoff and not session.lock.locked():
+                del self._sessions[session_id]
+
+
+sessions = SessionStore(SESSION_TTL, MAX_SESSIONS)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Unit tests for audio_probe
+Builds headers in memory, so no server or audio files are needed
+"""
+
+import io
+import struct
+import wave
+
+import pytest
+
+from audio_probe import CorruptAudioError, UnsupportedAudioError, probe_audio, sniff_format
+
+
+def make_wav(seconds=1.0, sample_rate=16000, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(b"\x00\x00" * channels * int(seconds * sample_rate))
+    return buffer.getvalue()
+
+
+def with_data_size(wav, size):
+    """Overwrite the declared size of the data chunk, as streaming writers leave it"""
+    position = wav.index(b"data") + 4
+    return wav[:position] + struct.pack("<I", size) + wav[position + 4:]
+
+
+def make_flac(total_samples, sample_rate=44100, channels=2):
+    fields = (sample_rate << 44) | ((channels - 1) << 41) | (15 << 36) | total_samples
+    streaminfo = b"\x00" * 10 + fields.to_bytes(8, "big") + b"\x00" * 16
+    return b"fLaC" + b"\x80" + len(streaminfo).to_bytes(3, "big") + streaminfo
+
+
+def make_aiff(frames, rate_exponent=16383 + 13, rate_mantissa=16000 << 50, channels=1):
+    sample_rate = struct.pack(">HQ", rate_exponent, rate_mantissa)
+    comm = struct.pack(">HIH", channels, frames, 16) + sample_rate
+    body = b"AIFF" + b"COMM" + struct.pack(">I", len(comm)) + comm
+    return b"FORM" + struct.pack(">I", len(body)) + body
+
+
+def box(box_type, payload):
+    return struct.pack(">I", 8 + len(payload)) + box_type + payload
+
+
+def make_mp4(duration, timescale=1000, sample_rate=44100, channels=2, fragmented=False):
+    mvhd = box(b"mvhd", b"\x00" * 12 + struct.pack(">II", timescale, duration) + b"\x00" * 80)
+    hdlr = box(b"hdlr", b"\x00" * 8 + b"soun" + b"\x00" * 13)
+    entry = box(b"mp4a", b"\x00" * 16 + struct.pack(">HHHHI", channels, 16, 0, 0, sample_rate << 16))
+    stsd = box(b"stsd", struct.pack(">II", 0, 1) + entry)
+    trak = box(b"trak", box(b"mdia", hdlr + box(b"minf", box(b"stbl", stsd))))
+    data = box(b"ftyp", b"M4A \x00\x00\x00\x00") + box(b"moov", mvhd + trak)
+    if fragmented:
+        data += box(b"moof", box(b"mfhd", b"\x00" * 8)) + box(b"mdat", b"\x00" * 64)
+    return data
+
+
+def make_mp3_frame():
+    # MPEG-1 layer III, 128 kbit/s, 44.1 kHz, stereo
+    return b"\xff\xfb\x90\x00" + b"\x00" * 413
+
+
+def test_sniff_format():
+    assert sniff_format(make_wav()) == "wav"
+    assert sniff_format(make_flac(44100)) == "flac"
+    assert sniff_format(make_aiff(16000)) == "aiff"
+    assert sniff_format(make_mp3_frame()) == "mp3"
+    assert sniff_format(b"not audio at all") is None
+
+
+def test_wav():
+    info = probe_audio(make_wav(seconds=2.0, sample_rate=16000, channels=2))
+    assert info == {"format": "wav", "duration": 2.0, "sample_rate": 16000, "channels": 2}
+
+
+@pytest.mark.parametrize("declared", [0, 0xFFFFFFFF])
+def test_wav_streaming_placeholder_size_uses_remaining_bytes(declared):
+    info = probe_audio(with_data_size(make_wav(seconds=1.5), declared))
+    assert info["duration"] == 1.5
+
+
+def test_wav_truncated_uses_remaining_bytes():
+    wav = make_wav(seconds=2.0)
+    info = probe_audio(wav[:len(wav) - 16000])
+    assert info["duration"] == 1.5
+
+
+def test_wav_without_audio_is_corrupt():
+    with pytest.raises(CorruptAudioError):
+        probe_audio(make_wav(seconds=0))
+
+
+def test_wav_without_data_chunk_is_corrupt():
+    wav = make_wav()
+    with pytest.raises(CorruptAudioError):
+        probe_audio(wav[:wav.index(b"data")])
+
+
+def test_flac():
+    info = probe_audio(make_flac(total_samples=88200))
+    assert info == {"format": "flac", "duration": 2.0, "sample_rate": 44100, "channels": 2}
+
+
+def test_flac_unknown_length():
+    assert probe_audio(make_flac(total_samples=0))["duration"] is None
+
+
+def test_aiff():
+    info = probe_audio(make_aiff(frames=32000))
+    assert info == {"format": "aiff", "duration": 2.0, "sample_rate": 16000, "channels": 1}
+
+
+def test_aiff_sample_rate_overflow_is_corrupt():
+    with pytest.raises(CorruptAudioError):
+        probe_audio(make_aiff(frames=16000, rate_exponent=0x7FFE))
+
+
+def test_mp4():
+    info = probe_audio(make_mp4(duration=2500))
+    assert info == {"format": "mp4", "duration": 2.5, "sample_rate": 44100, "channels": 2}
+
+
+def test_fragmented_mp4_unknown_length():
+    info = probe_audio(make_mp4(duration=0, fragmented=True))
+    assert info["duration"] is None
+    assert info["sample_rate"] == 44100
+
+
+def test_mp3_constant_bitrate():
+    info = probe_audio(make_mp3_frame() * 100)
+    assert info["sample_rate"] == 44100
+    assert info["channels"] == 2
+    assert info["duration"] == pytest.approx(100 * 417 * 8 / 128000, abs=0.001)
+
+
+def test_empty_upload_is_corrupt():
+    with pytest.raises(CorruptAudioError):
+        probe_audio(b"")
+
+
+def test_unknown_format_is_unsupported():
+    with pytest.raises(UnsupportedAudioError):
+        probe_audio(b"<html>not audio</html>")
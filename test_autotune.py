@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Unit tests for autotune
+Uses stub transcribe callables, so no model is needed
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+import autotune
+
+
+@pytest.fixture
+def autotune_file(tmp_path, monkeypatch):
+    path = tmp_path / "autotune.json"
+    monkeypatch.setattr(autotune, "AUTOTUNE_FILE", str(path))
+    monkeypatch.setattr(autotune, "AUTOTUNE_ROUNDS", 1)
+    return path
+
+
+def test_failing_trial_is_not_chosen(autotune_file):
+    threads = {"current": 1}
+
+    def transcribe(audio):
+        if threads["current"] == 2:
+            raise MemoryError("out of memory")
+
+    candidates = [{"workers": 2, "torch_threads": 2}, {"workers": 1, "torch_threads": 1}]
+    result = autotune.calibrate(transcribe, lambda count: threads.update(current=count),
+                                np.zeros(1600, dtype=np.float32), candidates)
+    assert result["workers"] == 1
+    assert [trial["workers"] for trial in result["trials"]] == [1]
+    assert json.loads(autotune_file.read_text())["workers"] == 1
+
+
+def test_every_trial_failing_raises(autotune_file):
+    def transcribe(audio):
+        if threads_set:
+            raise MemoryError("out of memory")
+
+    threads_set = []
+    with pytest.raises(RuntimeError):
+        autotune.calibrate(transcribe, threads_set.append, np.zeros(1600, dtype=np.float32),
+                           [{"workers": 1, "torch_threads": 1}])
+    assert not autotune_file.exists()
+
+
+def test_env_workers_ignore_saved_thread_count(autotune_file, monkeypatch):
+    monkeypatch.setattr(autotune, "CPU_COUNT", 8)
+    autotune_file.write_text(json.dumps({"workers": 1, "torch_threads": 8, "host": autotune._host()}))
+    assert autotune.load_saved_config() is not None
+    monkeypatch.setenv("TRANSCRIBE_WORKERS", "4")
+    monkeypatch.delenv("TORCH_THREADS", raising=False)
+    assert autotune.resolve_config()["torch_threads"] == 2
+
+    monkeypatch.setenv("TORCH_THREADS", "3")
+    assert autotune.resolve_config()["torch_threads"] == 3
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Unit tests for decoding_guard
+Uses stand-in tokenizers and decoding results, so no model is needed
+"""
+
+import dataclasses
+import math
+from typing import List
+
+from decoding_guard import RunawayGuard, _repetition_start, mark_suppressed
+from window_tracking import decoding_window
+
+EOT = 100
+
+
+class FakeTokenizer:
+    eot = EOT
+
+
+@dataclasses.dataclass(frozen=True)
+class FakeResult:
+    tokens: List[int]
+    compression_ratio: float = 1.5
+
+
+def test_repetition_start_includes_earlier_copies():
+    # Four repeats of the two-token phrase trip the check; the two copies before them are included
+    tokens = [1, 2, 3] + [7, 8] * 6
+    assert _repetition_start(tokens, repeats=4) == 3
+
+
+def test_repetition_start_ignores_short_or_missing_runs():
+    assert _repetition_start([1, 2, 3, 4, 5, 6, 7, 8, 9], repeats=4) is None
+    # A single token four times is shorter than the minimum run
+    assert _repetition_start([1, 2, 5, 5, 5, 5], repeats=4) is None
+
+
+def test_mark_suppressed_only_from_runaway_start():
+    trips = {0: {"reason": "repetition", "start_token": 5, "eot": EOT}}
+    segments = [
+        {"seek": 0, "tokens": [1, 2, 3, 150]},
+        {"seek": 0, "tokens": [4, 5, 6, 7, 160]},
+        {"seek": 3000, "tokens": [8, 9, 170]},
+    ]
+    mark_suppressed(segments, trips)
+    assert "suppressed" not in segments[0]
+    assert segments[1]["suppressed"] is True
+    assert segments[1]["suppressed_reason"] == "repetition"
+    assert "suppressed" not in segments[2]
+
+
+def test_settle_fails_tripped_result_and_records_trip():
+    trips = {}
+    with decoding_window(1500):
+        guard = RunawayGuard(FakeTokenizer(), sample_begin=3, trips=trips)
+    guard.tripped.append({"reason": "repetition", "start_token": 2, "text_tokens": [1, 2, 7, 7]})
+
+    tripped, clean = guard.settle([FakeResult([1, 2, 7, 7, EOT]), FakeResult([1, 2, 3, EOT])])
+    assert math.isinf(tripped.compression_ratio)
+    assert clean.compression_ratio == 1.5
+    assert trips == {1500: {"reason": "repetition", "start_token": 2, "eot": EOT}}
+
+
+def test_retry_clears_previous_trip():
+    trips = {1500: {"reason": "repetition", "start_token": 2, "eot": EOT}}
+    with decoding_window(1500):
+        guard = RunawayGuard(FakeTokenizer(), sample_begin=3, trips=trips)
+    guard.settle([FakeResult([1, 2, 3, EOT])])
+    assert trips == {}
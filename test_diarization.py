@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Unit tests for diarization clustering
+Uses synthetic embeddings, so no model or audio files are needed
+"""
+
+import numpy as np
+import pytest
+
+from diarization import _cluster
+
+
+def near(vector, count, seed):
+    rng = np.random.default_rng(seed)
+    return vector + 0.01 * rng.standard_normal((count, len(vector)))
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 6])
+def test_one_speaker_gets_one_label(count):
+    speaker = np.random.default_rng(0).standard_normal(64)
+    assert _cluster(near(speaker, count, seed=1)) == [0] * count
+
+
+def test_two_separated_speakers_get_two_labels():
+    rng = np.random.default_rng(0)
+    first, second = rng.standard_normal(64), rng.standard_normal(64)
+    embeddings = np.concatenate([near(first, 3, seed=1), near(second, 3, seed=2)])
+    labels = _cluster(embeddings)
+    assert len(set(labels[:3])) == 1
+    assert len(set(labels[3:])) == 1
+    assert labels[0] != labels[3]
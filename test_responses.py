@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Unit tests for response negotiation
+"""
+
+import gzip
+
+import pytest
+
+import responses
+from responses import JSON, MSGPACK, _compress, _negotiate_media_type
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("", JSON),
+    ("application/msgpack", MSGPACK),
+    ("application/json, application/msgpack", JSON),
+    ("application/json;q=0.5, application/msgpack", MSGPACK),
+    ("application/msgpack;q=0, application/json", JSON),
+    ("application/msgpack;q=0", JSON),
+    ("application/x-msgpack;q=0.9, text/html", MSGPACK),
+])
+def test_negotiate_media_type(accept, expected):
+    if responses.msgpack is None:
+        pytest.skip("msgpack is not installed")
+    assert _negotiate_media_type(accept) == expected
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    ("", None),
+    ("gzip", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=0, br", None),
+    ("zstd, gzip", "gzip"),
+])
+def test_compress_without_zstd(accept_encoding, expected, monkeypatch):
+    monkeypatch.setattr(responses, "zstandard", None)
+    body, encoding = _compress(b"x" * 2048, accept_encoding)
+    assert encoding == expected
+    if encoding == "gzip":
+        assert gzip.decompress(body) == b"x" * 2048
+
+
+def test_compress_prefers_higher_q(monkeypatch):
+    monkeypatch.setattr(responses, "zstandard", object())
+    assert _compress(b"x" * 2048, "zstd;q=0.5, gzip")[1] == "gzip"
+    assert _compress(b"x" * 2048, "zstd;q=0, gzip;q=0.1")[1] == "gzip"
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the priority scheduler
+Uses blocking stand-in jobs, so no model is needed
+"""
+
+import asyncio
+import threading
+
+from scheduler import PriorityScheduler
+
+
+class Job:
+    """A blocking call that records when it starts and runs until released"""
+
+    def __init__(self, name, started):
+        self.name = name
+        self.started = started
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.started.append(self.name)
+        self.release.wait(5)
+        return self.name
+
+
+async def until(condition, timeout=5.0):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+def test_batch_never_takes_reserved_workers():
+    async def scenario():
+        scheduler = PriorityScheduler(workers=2, live_reserved=1, live_slo=1.0)
+        started = []
+        batch = [Job(f"batch{i}", started) for i in range(2)]
+        live = Job("live", started)
+        tasks = [asyncio.create_task(scheduler.run("batch", job)) for job in batch]
+        await until(lambda: started == ["batch0"])
+        await asyncio.sleep(0.05)
+        assert started == ["batch0"]
+
+        # The reserved worker is still free for captions
+        tasks.append(asyncio.create_task(scheduler.run("live", live)))
+        await until(lambda: "live" in started)
+        for job in batch + [live]:
+            job.release.set()
+        await asyncio.gather(*tasks)
+        assert started == ["batch0", "live", "batch1"]
+
+    asyncio.run(scenario())
+
+
+def test_live_starts_before_waiting_batch():
+    async def scenario():
+        scheduler = PriorityScheduler(workers=1, live_reserved=1, live_slo=1.0)
+        started = []
+        running, queued_batch, queued_live = Job("running", started), Job("batch", started), Job("live", started)
+        tasks = [asyncio.create_task(scheduler.run("batch", running))]
+        await until(lambda: started == ["running"])
+        tasks.append(asyncio.create_task(scheduler.run("batch", queued_batch)))
+        await until(lambda: scheduler.stats()["lanes"]["batch"]["waiting"] == 1)
+        tasks.append(asyncio.create_task(scheduler.run("live", queued_live)))
+        await until(lambda: scheduler.stats()["lanes"]["live"]["waiting"] == 1)
+
+        for job in (running, queued_batch, queued_live):
+            job.release.set()
+        await asyncio.gather(*tasks)
+        assert started == ["running", "live", "batch"]
+
+    asyncio.run(scenario())
+
+
+def test_hold_waits_for_running_work_and_blocks_new_work():
+    async def scenario():
+        scheduler = PriorityScheduler(workers=2, live_reserved=1, live_slo=1.0)
+        started = []
+        running, queued = Job("running", started), Job("queued", started)
+        first = asyncio.create_task(scheduler.run("live", running))
+        await until(lambda: started == ["running"])
+
+        held = asyncio.Event()
+        leave = asyncio.Event()
+
+        async def hold():
+            async with scheduler.hold():
+                held.set()
+                await leave.wait()
+
+        holder = asyncio.create_task(hold())
+        await asyncio.sleep(0.05)
+        assert not held.is_set()
+
+        second = asyncio.create_task(scheduler.run("live", queued))
+        running.release.set()
+        await asyncio.wait_for(held.wait(), 5)
+        await asyncio.sleep(0.05)
+        assert started == ["running"]
+
+        leave.set()
+        queued.release.set()
+        await asyncio.gather(first, holder, second)
+        assert started == ["running", "queued"]
+
+    asyncio.run(scenario())
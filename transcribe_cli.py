@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Offline bulk transcription for TalkVision
+Transcribes a directory or manifest of audio files without going through HTTP
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from whisper_model import SAMPLE_RATE, load_audio, transcribe_audio
+
+AUDIO_EXTENSIONS = ["wav", "mp3", "m4a", "flac", "ogg", "webm", "mp4"]
+
+
+def find_audio_files(directory, extensions):
+    """Recursively list audio files under a directory in a stable order"""
+    suffixes = tuple(f".{extension.lower().lstrip('.')}" for extension in extensions)
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(suffixes):
+                paths.append(os.path.abspath(os.path.join(root, name)))
+    return paths
+
+
+def read_manifest(manifest_path):
+    """Read audio paths from a manifest: one path per line, or JSON lines with a "path" key"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    paths = []
+    with open(manifest_path) as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            path = json.loads(line)["path"] if line.startswith("{") else line
+            paths.append(os.path.abspath(os.path.join(base_dir, path)))
+    return paths
+
+
+def load_checkpoint(output_path):
+    """Return the paths already transcribed successfully in a previous run"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path) as output:
+        for line in output:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a truncated last line
+                continue
+            if "error" not in record:
+                done.add(record["path"])
+    return done
+
+
+def prefetch_audio(paths, workers, depth):
+    """
+    Decode files on a thread pool ahead of the model.
+
+    Yields (path, future) in input order while keeping at most `depth`
+    decoded files in memory.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        remaining = iter(paths)
+        pending = deque()
+        for path in remaining:
+            pending.append((path, pool.submit(load_audio, path)))
+            if len(pending) >= depth:
+                break
+        while pending:
+            path, future = pending.popleft()
+            next_path = next(remaining, None)
+            if next_path is not None:
+                pending.append((next_path, pool.submit(load_audio, next_path)))
+            yield path, future
+
+
+def format_srt_time(seconds):
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600000)
+    minutes, milliseconds = divmod(milliseconds, 60000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+
+
+def write_srt(segments, srt_path):
+    os.makedirs(os.path.dirname(srt_path) or ".", exist_ok=True)
+    with open(srt_path, "w", encoding="utf-8") as srt_file:
+        subtitles = [segment for segment in segments if not segment.get("suppressed")]
+        for index, segment in enumerate(subtitles, start=1):
+            srt_file.write(f"{index}\n")
+            srt_file.write(f"{format_srt_time(segment['start'])} --> {format_srt_time(segment['end'])}\n")
+            srt_file.write(f"{segment['text'].strip()}\n\n")
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as existing:
+        existing.seek(-1, os.SEEK_END)
+        return existing.read(1) == b"\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe a directory or manifest of audio files")
+    parser.add_argument("input", help="Directory to scan, or a manifest file with --manifest")
+    parser.add_argument("--manifest", action="store_true", help="Treat input as a manifest file")
+    parser.add_argument("--output", default="transcripts.jsonl",
+                        help="JSONL results file, also used as the resume checkpoint")
+    parser.add_argument("--srt-dir", help="Also write one .srt file per input into this directory")
+    parser.add_argument("--language", help="Language code; auto-detect when omitted")
+    parser.add_argument("--diarize", action="store_true", help="Label segments with speakers")
+    parser.add_argument("--workers", type=int, default=4, help="Threads decoding audio ahead of the model")
+    parser.add_argument("--prefetch", type=int, default=8, help="Maximum number of decoded files held in memory")
+    parser.add_argument("--extensions", default=",".join(AUDIO_EXTENSIONS),
+                        help="Comma-separated extensions to pick up when scanning a directory")
+    args = parser.parse_args()
+
+    if args.manifest:
+        paths = read_manifest(args.input)
+        root = os.path.dirname(os.path.abspath(args.input))
+    else:
+        paths = find_audio_files(args.input, args.extensions.split(","))
+        root = os.path.abspath(args.input)
+
+    done = load_checkpoint(args.output)
+    todo = [path for path in paths if path not in done]
+    print(f"🎧 {len(paths)} files found, {len(paths) - len(todo)} already done, {len(todo)} to transcribe")
+    if not todo:
+        return 0
+
+    failures = 0
+    started = time.time()
+    audio_seconds = 0.0
+    with open(args.output, "a", encoding="utf-8") as output:
+        if output.tell() > 0 and not _ends_with_newline(args.output):
+            # Terminate a line truncated by a killed run so the next record starts cleanly
+            output.write("\n")
+        for count, (path, future) in enumerate(prefetch_audio(todo, args.workers, args.prefetch), start=1):
+            try:
+                audio = future.result()
+                result = transcribe_audio(audio, language=args.language, diarize=args.diarize)
+                duration = len(audio) / SAMPLE_RATE
+                audio_seconds += duration
+                record = {
+                    "path": path,
+                    "duration": round(duration, 3),
+                    "text": result["text"],
+                    "language": result["language"],
+                    "confidence": result["confidence"],
+                    "segments": [
+                        {
+                            "start": round(segment["start"], 3),
+                            "end": round(segment["end"], 3),
+                            "text": segment["text"].strip(),
+                            **({"speaker": segment["speaker"]} if "speaker" in segment else {}),
+                            **({"suppressed": True} if segment.get("suppressed") else {})
+                        }
+                        for segment in result["segments"]
+                    ]
+                }
+                if args.srt_dir:
+                    relative = os.path.relpath(path, root)
+                    write_srt(result["segments"], os.path.join(args.srt_dir, os.path.splitext(relative)[0] + ".srt"))
+                print(f"✅ [{count}/{len(todo)}] {path}")
+            except Exception as e:
+                failures += 1
+                record = {"path": path, "error": str(e)}
+                print(f"❌ [{count}/{len(todo)}] {path}: {e}")
+
+            # One complete line per file, flushed so a killed run resumes after it
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            os.fsync(output.fileno())
+
+    elapsed = time.time() - started
+    print(f"\n⏱️  {len(todo)} files, {audio_seconds:.1f}s of audio in {elapsed:.1f}s "
+          f"({audio_seconds / elapsed if elapsed else 0:.1f}x realtime), {failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
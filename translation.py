@@ -0,0 +1,154 @@
+# translation.py
+import bisect
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from decoding_guard import guard_decoding
+from window_tracking import decoding_window
+
+# Same fallback schedule and thresholds model.transcribe uses by default
+TRANSLATION_TEMPERATURES = (0.0, 0.2, 0.4, 0.6, 0.8, 1.0)
+TRANSLATION_COMPRESSION_RATIO = float(os.getenv("TRANSLATION_COMPRESSION_RATIO", 2.4))
+TRANSLATION_LOGPROB_THRESHOLD = float(os.getenv("TRANSLATION_LOGPROB_THRESHOLD", -1.0))
+TRANSLATION_NO_SPEECH_THRESHOLD = float(os.getenv("TRANSLATION_NO_SPEECH_THRESHOLD", 0.6))
+
+MEL_FRAMES_PER_SECOND = 100
+# Timestamp tokens count in steps of 20 ms
+TIME_PRECISION = 0.02
+WINDOW_SECONDS = 30.0
+
+
+def translate_windows(model, features: Dict[int, np.ndarray], segments: List[Dict], language: str,
+                      duration: float) -> List[Dict]:
+    """
+    Translate a finished transcription to English without re-running the encoder.
+
+    Each window that produced transcribed speech is decoded again with the
+    translate task, straight from the encoder output captured while it was
+    transcribed. Translation windows are therefore exactly the transcription
+    windows, and each translated segment carries the same "seek".
+
+    model.transcribe only advances to the last complete timestamp, so the
+    next window starts inside this one and decodes its unfinished tail again.
+    Each window's translation is cut off where the next window starts.
+
+    Returns:
+        list: Translated segments with start, end, text and seek
+    """
+    import torch
+    from whisper.tokenizer import get_tokenizer
+
+    tokenizer = get_tokenizer(model.is_multilingual, num_languages=getattr(model, "num_languages", 99),
+                              language=language, task="translate")
+    fp16 = model.device.type != "cpu"
+    captured = sorted(features)
+    seeks = sorted({segment["seek"] for segment in segments if not segment.get("suppressed")})
+
+    translated = []
+    prompt: List[int] = []
+    with guard_decoding() as trips:
+        for seek in seeks:
+            window = features.get(seek)
+            if window is None:
+                continue
+            audio_features = torch.from_numpy(window).unsqueeze(0).to(model.device)
+            with decoding_window(seek):
+                result = _decode_with_fallback(model, audio_features, language, prompt, fp16)
+            if _is_silence(result):
+                continue
+
+            following = bisect.bisect_right(captured, seek)
+            window_end = min(seek / MEL_FRAMES_PER_SECOND + WINDOW_SECONDS, duration)
+            if following < len(captured):
+                window_end = min(window_end, captured[following] / MEL_FRAMES_PER_SECOND)
+            # Leave out text decoded after the guard found it running away
+            trip = trips.get(seek)
+            text_limit = trip["start_token"] if trip else None
+
+            pieces = _window_segments(tokenizer, result.tokens, seek, window_end, text_limit)
+            translated.extend(piece for piece in pieces if piece["start"] < window_end)
+            # Condition the next window on this one, as model.transcribe does
+            prompt = [token for token in result.tokens if token < tokenizer.eot][:text_limit]
+    return translated
+
+
+def align_translations(segments: List[Dict], translated: List[Dict]) -> List[Dict]:
+    """
+    Attach to each transcribed segment the translated text spoken during it.
+
+    A translated segment goes to the transcribed segment of the same window
+    that contains its midpoint, or the nearest one if none does.
+
+    Returns:
+        list: The same segments with a "translation" key added
+    """
+    by_window: Dict[int, List[Dict]] = {}
+    for segment in segments:
+        if not segment.get("suppressed"):
+            segment["translation"] = []
+            by_window.setdefault(segment["seek"], []).append(segment)
+
+    for piece in translated:
+        candidates = by_window.get(piece["seek"])
+        if not candidates:
+            continue
+        midpoint = (piece["start"] + piece["end"]) / 2
+        target = min(candidates, key=lambda segment: max(segment["start"] - midpoint, midpoint - segment["end"], 0.0))
+        target["translation"].append(piece["text"].strip())
+
+    for window in by_window.values():
+        for segment in window:
+            segment["translation"] = " ".join(text for text in segment["translation"] if text)
+    return segments
+
+
+def _decode_with_fallback(model, audio_features, language: str, prompt: List[int], fp16: bool):
+    from whisper.decoding import DecodingOptions
+
+    result = None
+    for temperature in TRANSLATION_TEMPERATURES:
+        options = DecodingOptions(task="translate", language=language, temperature=temperature,
+                                  prompt=prompt or None, fp16=fp16)
+        result = model.decode(audio_features, options)[0]
+        if _is_silence(result):
+            break
+        if (result.compression_ratio <= TRANSLATION_COMPRESSION_RATIO
+                and result.avg_logprob >= TRANSLATION_LOGPROB_THRESHOLD):
+            break
+    return result
+
+
+def _is_silence(result) -> bool:
+    return (result.no_speech_prob > TRANSLATION_NO_SPEECH_THRESHOLD
+            and result.avg_logprob < TRANSLATION_LOGPROB_THRESHOLD)
+
+
+def _window_segments(tokenizer, tokens: List[int], seek: int, window_end: float,
+                     text_limit: Optional[int] = None) -> List[Dict]:
+    """Split a window's tokens into segments at its timestamp tokens, keeping at most text_limit text tokens."""
+    offset = seek / MEL_FRAMES_PER_SECOND
+    segments = []
+    start = offset
+    text_tokens: List[int] = []
+    kept = 0
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            time = min(offset + (token - tokenizer.timestamp_begin) * TIME_PRECISION, window_end)
+            if text_tokens:
+                segments.append(_segment(tokenizer, text_tokens, start, time, seek))
+                text_tokens = []
+            start = time
+        elif token < tokenizer.eot:
+            if text_limit is not None and kept >= text_limit:
+                break
+            text_tokens.append(token)
+            kept += 1
+    if text_tokens:
+        segments.append(_segment(tokenizer, text_tokens, start, window_end, seek))
+    return segments
+
+
+def _segment(tokenizer, text_tokens: List[int], start: float, end: float, seek: int) -> Dict:
+    return {"start": start, "end": max(start, end), "text": tokenizer.decode(text_tokens), "seek": seek}
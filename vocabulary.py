@@ -0,0 +1,164 @@
+# vocabulary.py
+import json
+import logging
+import os
+import threading
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Registered vocabularies are persisted here so they survive restarts and are
+# shared by all workers; set to an empty string to keep them in memory only
+VOCABULARY_FILE = os.getenv("VOCABULARY_FILE", "vocabularies.json")
+VOCABULARY_MAX_TERMS = int(os.getenv("VOCABULARY_MAX_TERMS", 100))
+# Whisper keeps at most 223 prompt tokens; this leaves room for session context
+VOCABULARY_MAX_CHARS = int(os.getenv("VOCABULARY_MAX_CHARS", 600))
+
+
+class VocabularyError(ValueError):
+    """Raised when a vocabulary cannot be registered."""
+
+
+class VocabularyRegistry:
+    """
+    Per-tenant hotword lists, stored as ready-made decoder prompts.
+
+    The prompt text for a tenant is built once at registration, and the
+    prompt cache installed by install_prompt_cache() keeps its tokenization,
+    so requests neither rebuild nor re-tokenize it.
+
+    Transcriptions read the registry from worker threads, so changes build
+    a new dict and swap it in rather than modifying the one being read.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._vocabularies: Dict[str, Dict] = {}
+        self._prompts: frozenset = frozenset()
+        self._mtime = None
+        self._reload()
+
+    def register(self, tenant_id: str, terms: List[str]) -> Dict:
+        cleaned = []
+        for term in terms:
+            term = " ".join(str(term).split())
+            if term and term not in cleaned:
+                cleaned.append(term)
+        if not cleaned:
+            raise VocabularyError("Vocabulary must contain at least one term")
+        if len(cleaned) > VOCABULARY_MAX_TERMS:
+            raise VocabularyError(f"Too many terms. Maximum: {VOCABULARY_MAX_TERMS}")
+        prompt = ", ".join(cleaned) + "."
+        if len(prompt) > VOCABULARY_MAX_CHARS:
+            raise VocabularyError(f"Vocabulary too long. Maximum: {VOCABULARY_MAX_CHARS} characters")
+
+        with self._lock:
+            self._reload()
+            previous = self._vocabularies.get(tenant_id)
+            entry = {
+                "terms": cleaned,
+                "prompt": prompt,
+                "version": previous["version"] + 1 if previous else 1
+            }
+            self._swap({**self._vocabularies, tenant_id: entry})
+            self._save()
+        return {"tenant_id": tenant_id, **entry}
+
+    def get(self, tenant_id: str) -> Optional[Dict]:
+        self._reload()
+        entry = self._vocabularies.get(tenant_id)
+        return {"tenant_id": tenant_id, **entry} if entry else None
+
+    def remove(self, tenant_id: str) -> bool:
+        with self._lock:
+            self._reload()
+            removed = tenant_id in self._vocabularies
+            if removed:
+                self._swap({key: entry for key, entry in self._vocabularies.items() if key != tenant_id})
+                self._save()
+        return removed
+
+    def prompt(self, tenant_id: Optional[str]) -> Optional[str]:
+        """The decoder prompt registered for a tenant, if any."""
+        if not tenant_id:
+            return None
+        self._reload()
+        entry = self._vocabularies.get(tenant_id)
+        return entry["prompt"] if entry else None
+
+    def leading_prompt(self, text: str) -> Optional[str]:
+        """The registered prompt that text starts with, followed by a space or nothing."""
+        prompts = self._prompts
+        # Every prompt ends in "."
+        end = text.find(".", 0, VOCABULARY_MAX_CHARS)
+        while end != -1:
+            if text[end + 1:end + 2] in ("", " ") and text[:end + 1] in prompts:
+                return text[:end + 1]
+            end = text.find(".", end + 1, VOCABULARY_MAX_CHARS)
+        return None
+
+    def _swap(self, vocabularies: Dict[str, Dict]):
+        self._prompts = frozenset(entry["prompt"] for entry in vocabularies.values())
+        self._vocabularies = vocabularies
+
+    def _reload(self):
+        """Pick up registrations written by other workers."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path) as vocabulary_file:
+                self._swap(json.load(vocabulary_file))
+            self._mtime = mtime
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Failed to load vocabularies from {self.path}: {e}")
+
+    def _save(self):
+        if not self.path:
+            return
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as vocabulary_file:
+            json.dump(self._vocabularies, vocabulary_file, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        self._mtime = os.stat(self.path).st_mtime_ns
+
+
+def install_prompt_cache():
+    """
+    Memoize Whisper's tokenization of registered vocabulary prompts.
+
+    model.transcribe only accepts initial_prompt as text and encodes it on
+    every call. With this in place a registered prompt is encoded once per
+    tokenizer and reused until the vocabulary changes; when a session or
+    request adds its own prompt after it, only that part is encoded.
+    """
+    from whisper.tokenizer import Tokenizer
+
+    encode = Tokenizer.encode
+    cache: Dict[tuple, List[int]] = {}
+
+    def encode_with_cache(tokenizer, text, **kwargs):
+        # transcribe() encodes " " + initial_prompt, which starts with the tenant's prompt
+        prompt = registry.leading_prompt(text[1:]) if not kwargs and text.startswith(" ") else None
+        if prompt is None:
+            return encode(tokenizer, text, **kwargs)
+
+        key = (tokenizer.encoding.name, prompt)
+        tokens = cache.get(key)
+        if tokens is None:
+            tokens = encode(tokenizer, " " + prompt)
+            if len(cache) >= 4 * VOCABULARY_MAX_TERMS:
+                cache.clear()
+            cache[key] = tokens
+        # The tokenizer never merges the prompt's final "." with the space
+        # that follows, so the rest encodes the same on its own
+        rest = text[1 + len(prompt):]
+        return list(tokens) + (encode(tokenizer, rest) if rest else [])
+
+    Tokenizer.encode = encode_with_cache
+
+
+registry = VocabularyRegistry(VOCABULARY_FILE)
@@ -1,7 +1,20 @@
 # whisper_model.py
-import whisper
+import numpy as np
+import functools
+import importlib
 import os
-from typing import Dict, Optional
+import threading
+from typing import Dict, Optional, Union
+from profiling import PROFILING_ENABLED, span
+from diarization import assign_speakers, capture_encoder_outputs, install_encoder_capture
+from decoding_guard import guard_decoding, install_decoding_guard, mark_suppressed
+from window_tracking import install_window_tracking
+from vocabulary import install_prompt_cache, registry as vocabularies
+from autotune import tuning
+from translation import align_translations, translate_windows
+
+# whisper (and with it torch, tiktoken and numba) is imported on first use in
+# get_model() so the API layer starts without paying for it.
 
 # Get model type from environment variable, default to "base"
 MODEL_TYPE = os.getenv("WHISPER_MODEL", "base")
@@ -11,56 +24,248 @@ DEVICE = os.getenv("WHISPER_DEVICE", "cpu")
 CACHE_DIR = os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
 os.makedirs(CACHE_DIR, exist_ok=True)
 
-# Load the model globally so it stays in memory
-try:
-    model = whisper.load_model(MODEL_TYPE, device=DEVICE, download_root=CACHE_DIR)
-    print(f"✅ Whisper model '{MODEL_TYPE}' loaded successfully on {DEVICE}")
-except Exception as e:
-    print(f"❌ Error loading Whisper model: {e}")
-    # Fallback to tiny model if the specified model fails
+# Sample rate of the audio arrays the model consumes (whisper.audio.SAMPLE_RATE)
+SAMPLE_RATE = 16000
+
+# "translate" decodes straight to English; "both" adds an English translation
+# to the transcript, decoded from the same encoder outputs
+TASKS = ("transcribe", "translate", "both")
+
+# The model is loaded once on first use and then stays in memory
+model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    """Return the Whisper model, loading it on first call."""
+    global model
+    if model is not None:
+        return model
+    with _model_lock:
+        if model is None:
+            model = _load_model()
+            _scope_kv_cache_to_thread(model)
+            install_window_tracking()
+            install_encoder_capture(model)
+            install_decoding_guard()
+            install_prompt_cache()
+            if PROFILING_ENABLED:
+                _instrument_model(model)
+    return model
+
+def _load_model():
+    import whisper
+    
+    set_torch_threads(tuning["torch_threads"], tuning["torch_interop_threads"])
     try:
-        model = whisper.load_model("tiny", device="cpu", download_root=CACHE_DIR)
-        print("🔄 Fallback: Loaded 'tiny' model on CPU")
-    except Exception as fallback_error:
-        print(f"❌ Fallback also failed: {fallback_error}")
-        raise fallback_error
+        loaded = whisper.load_model(MODEL_TYPE, device=DEVICE, download_root=CACHE_DIR)
+        print(f"✅ Whisper model '{MODEL_TYPE}' loaded successfully on {DEVICE}")
+        return loaded
+    except Exception as e:
+        print(f"❌ Error loading Whisper model: {e}")
+        # Fallback to tiny model if the specified model fails
+        try:
+            loaded = whisper.load_model("tiny", device="cpu", download_root=CACHE_DIR)
+            print("🔄 Fallback: Loaded 'tiny' model on CPU")
+            return loaded
+        except Exception as fallback_error:
+            print(f"❌ Fallback also failed: {fallback_error}")
+            raise fallback_error
+
+def set_torch_threads(threads: int, interop_threads: Optional[int] = None):
+    """Limit the threads each transcription uses inside torch."""
+    import torch
+    
+    torch.set_num_threads(threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError:
+            # Only allowed before torch has run any parallel work
+            pass
+    tuning["torch_threads"] = threads
+
+def _scope_kv_cache_to_thread(model):
+    """
+    Make Whisper's decoder KV cache safe for concurrent transcriptions.
+    
+    install_kv_cache_hooks registers hooks on the decoder's shared key/value
+    layers that replace their output with the cached tensor, so with more
+    than one worker each decode would read the others' caches. The hooks are
+    rewrapped to act only on the thread that installed them.
+    """
+    install_kv_cache_hooks = model.install_kv_cache_hooks
+
+    def install_for_current_thread(cache=None):
+        owner = threading.get_ident()
+        cache, hooks = install_kv_cache_hooks(cache)
+        for handle in hooks:
+            registered = handle.hooks_dict_ref()
+            hook = registered[handle.id]
+
+            def thread_hook(module, inputs, output, hook=hook):
+                if threading.get_ident() == owner:
+                    return hook(module, inputs, output)
+
+            registered[handle.id] = thread_hook
+        return cache, hooks
+
+    model.install_kv_cache_hooks = install_for_current_thread
 
-def transcribe_audio(file_path: str, language: Optional[str] = None) -> Dict:
+def _instrument_model(model):
+    """Wrap the stages inside model.transcribe so they are recorded as spans."""
+    import whisper
+    
+    transcribe_module = importlib.import_module("whisper.transcribe")
+    log_mel_spectrogram = transcribe_module.log_mel_spectrogram
+    decode = model.decode
+    encoder_forward = model.encoder.forward
+
+    def traced_log_mel_spectrogram(*args, **kwargs):
+        with span("mel"):
+            return log_mel_spectrogram(*args, **kwargs)
+
+    def traced_decode(mel, options=whisper.DecodingOptions(), **kwargs):
+        # Called once per 30 s window and temperature; temperature > 0 is a fallback retry
+        temperature = getattr(options, "temperature", 0.0)
+        with span("decode_window", temperature=temperature, fallback=temperature > 0):
+            return decode(mel, options, **kwargs)
+
+    def traced_encoder_forward(*args, **kwargs):
+        with span("encoder"):
+            return encoder_forward(*args, **kwargs)
+
+    transcribe_module.log_mel_spectrogram = traced_log_mel_spectrogram
+    model.decode = traced_decode
+    model.encoder.forward = traced_encoder_forward
+
+def load_audio(file_path: str) -> np.ndarray:
+    """Decode an audio file to 16 kHz mono float32 samples."""
+    import whisper
+    
+    return whisper.load_audio(file_path)
+
+def transcribe_audio(file_path: Union[str, np.ndarray], language: Optional[str] = None,
+                     initial_prompt: Optional[str] = None, diarize: bool = False,
+                     tenant: Optional[str] = None, task: str = "transcribe") -> Dict:
     """
     Transcribe the given audio file and return the result as a dictionary.
     
     Args:
-        file_path (str): Path to the audio file
+        file_path (str or np.ndarray): Path to the audio file, or 16 kHz mono
+                                       float32 samples
         language (str, optional): Language code (e.g., 'en', 'es', 'fr')
                                 If None, auto-detect language
+        initial_prompt (str, optional): Text used as decoder context for the
+                                        first window, e.g. the previous transcript
+        diarize (bool): Add a "speaker" label to each segment, clustered from
+                        the encoder outputs computed during transcription
+        tenant (str, optional): Tenant whose registered vocabulary biases
+                                every decoding window
+        task (str): "transcribe", "translate" to English, or "both"
     
     Returns:
-        dict: Transcription result with text, segments, and language info
+        dict: Transcription result with text, segments, and language info.
+              Segments holding text where decoding still ran away after
+              the temperature fallback are flagged "suppressed" and left
+              out of the text. With task "both" there
+              is also an English "translation", and each segment carries
+              the translation of what was said during it.
         
     Raises:
         Exception: If transcription fails
     """
     try:
-        # Transcribe with or without language specification
+        options = {}
         if language:
-            result = model.transcribe(file_path, language=language)
+            options["language"] = language
         else:
             # Auto-detect language if ENABLE_LANGUAGE_DETECTION is true
             enable_detection = os.getenv("ENABLE_LANGUAGE_DETECTION", "true").lower() == "true"
-            if enable_detection:
-                result = model.transcribe(file_path)
+            if not enable_detection:
+                options["language"] = "en"
+        vocabulary_prompt = vocabularies.prompt(tenant)
+        if vocabulary_prompt:
+            # Keep the hotwords in front of every window, not just the first
+            options["initial_prompt"] = f"{vocabulary_prompt} {initial_prompt}" if initial_prompt else vocabulary_prompt
+            if _supports_carry_initial_prompt():
+                options["carry_initial_prompt"] = True
+        elif initial_prompt:
+            options["initial_prompt"] = initial_prompt
+        if task == "translate":
+            options["task"] = "translate"
+        
+        with span("transcribe_audio") as transcribe_span:
+            if isinstance(file_path, str):
+                with span("load_audio"):
+                    audio = load_audio(file_path)
             else:
-                result = model.transcribe(file_path, language="en")
+                audio = file_path
+            transcribe_span.set_attribute("audio_seconds", round(len(audio) / SAMPLE_RATE, 3))
+            
+            with guard_decoding() as trips:
+                if diarize or task == "both":
+                    with capture_encoder_outputs() as features:
+                        result = get_model().transcribe(audio, **options)
+                else:
+                    result = get_model().transcribe(audio, **options)
+            segments = mark_suppressed(result.get("segments", []), trips)
+            if diarize:
+                with span("diarize"):
+                    assign_speakers(audio, segments, features)
+            if task == "both":
+                with span("translate"):
+                    _add_translation(audio, segments, features, result.get("language"))
+            transcribe_span.set_attribute("segments", len(segments))
+            transcribe_span.set_attribute("suppressed_windows", len(trips))
         
-        return {
-            "text": result["text"].strip(),
-            "segments": result.get("segments", []),
+        text = result["text"]
+        kept = [segment for segment in segments if not segment.get("suppressed")]
+        if len(kept) < len(segments):
+            text = "".join(segment["text"] for segment in kept)
+        
+        transcription = {
+            "text": text.strip(),
+            "segments": segments,
             "language": result.get("language", "unknown"),
-            "confidence": _calculate_confidence(result.get("segments", []))
+            "confidence": _calculate_confidence(kept)
         }
+        if task == "both":
+            transcription["translation"] = " ".join(
+                segment["translation"] for segment in kept if segment["translation"]
+            )
+        return transcription
     except Exception as e:
         raise Exception(f"Transcription failed: {str(e)}")
 
+def calibration_transcribe(audio: np.ndarray):
+    """
+    Transcribe for autotune, timing a single plain decode of each window.
+
+    The language is pinned and neither the temperature fallback nor the
+    runaway guard runs, so calibration audio that decodes to repetitive
+    text is timed like normal speech instead of retried or cut short.
+    """
+    get_model().transcribe(audio, language="en", temperature=0.0, condition_on_previous_text=False)
+
+def _add_translation(audio: np.ndarray, segments: list, features: Dict, language: Optional[str]):
+    """Translate the transcribed windows to English from their captured encoder outputs."""
+    if language == "en":
+        # Already English; a translate decode would only paraphrase it
+        for segment in segments:
+            if not segment.get("suppressed"):
+                segment["translation"] = segment["text"].strip()
+        return
+    translated = translate_windows(get_model(), features, segments, language, len(audio) / SAMPLE_RATE)
+    align_translations(segments, translated)
+
+@functools.lru_cache(maxsize=None)
+def _supports_carry_initial_prompt() -> bool:
+    """carry_initial_prompt was added to model.transcribe in openai-whisper 20240930."""
+    import inspect
+    
+    transcribe_module = importlib.import_module("whisper.transcribe")
+    return "carry_initial_prompt" in inspect.signature(transcribe_module.transcribe).parameters
+
 def _calculate_confidence(segments: list) -> float:
     """Calculate average confidence score from segments."""
     if not segments:
@@ -76,9 +281,16 @@ def _calculate_confidence(segments: list) -> float:
     return sum(confidences) / len(confidences) if confidences else 0.0
 
 def get_model_info() -> Dict:
-    """Get information about the current model."""
+    """Get information about the current model without forcing it to load."""
+    if model is not None:
+        is_multilingual = getattr(model, "is_multilingual", False)
+    else:
+        # English-only checkpoints are named like "base.en"
+        is_multilingual = not MODEL_TYPE.endswith(".en")
     return {
         "model_type": MODEL_TYPE,
         "device": DEVICE,
-        "is_multilingual": hasattr(model, 'is_multilingual') and model.is_multilingual
-    }
\ No newline at end of file
+        "is_multilingual": is_multilingual,
+        "loaded": model is not None,
+        "tuning": dict(tuning)
+    }
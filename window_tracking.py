@@ -0,0 +1,41 @@
+# window_tracking.py
+import importlib
+import threading
+from contextlib import contextmanager
+
+_state = threading.local()
+
+
+def install_window_tracking():
+    """
+    Track which 30 s window model.transcribe is working on in each thread.
+
+    model.transcribe slices each window out of one mel tensor before passing
+    it to pad_or_trim, so the slice's storage offset is the window's seek
+    position in mel frames, the same value reported as a segment's "seek".
+    """
+    transcribe_module = importlib.import_module("whisper.transcribe")
+    pad_or_trim = transcribe_module.pad_or_trim
+
+    def tracking_pad_or_trim(array, *args, **kwargs):
+        if hasattr(array, "storage_offset"):
+            _state.seek = array.storage_offset()
+        return pad_or_trim(array, *args, **kwargs)
+
+    transcribe_module.pad_or_trim = tracking_pad_or_trim
+
+
+def current_window_seek() -> int:
+    """Seek, in mel frames, of the window being decoded on this thread."""
+    return getattr(_state, "seek", 0)
+
+
+@contextmanager
+def decoding_window(seek: int):
+    """Attribute decodes run outside model.transcribe on this thread to the window at seek."""
+    previous = getattr(_state, "seek", 0)
+    _state.seek = seek
+    try:
+        yield
+    finally:
+        _state.seek = previous